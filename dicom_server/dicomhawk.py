@@ -1,65 +1,496 @@
+import time
+# Startup is timed from here, before the DICOM libraries are imported, see serve_dicom_ports
+startup_started = time.monotonic()
+
 import logging
-from logging.handlers import TimedRotatingFileHandler
-from pynetdicom import AE, evt, debug_logger, StoragePresentationContexts, VerificationPresentationContexts, QueryRetrievePresentationContexts
+from logging.handlers import QueueHandler, TimedRotatingFileHandler
+from pynetdicom import AE, evt, _config, build_context, StoragePresentationContexts, VerificationPresentationContexts, QueryRetrievePresentationContexts
+from pynetdicom._handlers import (
+    standard_dimse_recv_handler,
+    standard_dimse_sent_handler,
+    standard_pdu_recv_handler,
+    standard_pdu_sent_handler
+)
 from pynetdicom.sop_class import (
     PatientRootQueryRetrieveInformationModelFind,
+    StudyRootQueryRetrieveInformationModelFind,
     PatientRootQueryRetrieveInformationModelGet,
+    PatientRootQueryRetrieveInformationModelMove,
     CTImageStorage,
     MRImageStorage,
     Verification
 )
-from pydicom.dataset import Dataset, FileDataset
-from pydicom.uid import generate_uid, ExplicitVRLittleEndian, PYDICOM_IMPLEMENTATION_UID
+from pynetdicom.dsutils import split_dataset
+from pynetdicom.pdu_primitives import A_ASSOCIATE
+from pynetdicom.transport import AssociationServer
+import pynetdicom.association
+from pydicom.dataset import Dataset, FileDataset, FileMetaDataset
+from pydicom.uid import UID, generate_uid, ExplicitVRLittleEndian, ImplicitVRLittleEndian, PYDICOM_IMPLEMENTATION_UID
+from pydicom.filereader import read_dataset
+from pydicom.filewriter import write_file_meta_info
+from pydicom.datadict import tag_for_keyword
+from pydicom.dataelem import DataElement
+from pydicom.multival import MultiValue
 import pydicom
 import os
+import hashlib
+import zlib
+import gzip
+import shutil
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import socket
-from datetime import datetime
+import signal
+from datetime import datetime, timedelta
 import json
-import time
 import random
+import queue
+import threading
+import copy
+import atexit
+import functools
+import inspect
+import re
+import glob
+import bisect
+from collections import OrderedDict, deque
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+
+# Logs and the spool live on the volume shared with the log server;
+# DICOMHAWK_DATA_DIR moves them, e.g. for a local benchmark run
+data_directory = os.environ.get('DICOMHAWK_DATA_DIR', '/app')
 
 # Set up logging
-log_directory = '/app/logs'
-simplified_log_directory = '/app/simplified_logs'
+log_directory = os.path.join(data_directory, 'logs')
+simplified_log_directory = os.path.join(data_directory, 'simplified_logs')
 
 log_file_path = os.path.join(log_directory, 'dicom_server.log')
 simplified_log_file_path = os.path.join(simplified_log_directory, 'dicom_simplified.log')
 exception_log_file_path = os.path.join(log_directory, 'exception.log')
 
-os.makedirs(log_directory, exist_ok=True)
-os.makedirs(simplified_log_directory, exist_ok=True)
+# Verbosity of the detailed log (dicom_server.log), DETAILED_LOG_MODE is one of
+#   off     - warnings and errors only
+#   summary - one line per association event and DIMSE request
+#   full    - summary plus pynetdicom's PDU and DIMSE dumps for the first
+#             DETAILED_LOG_SAMPLE_FIRST associations from each peer address,
+#             then for a DETAILED_LOG_SAMPLE_RATE fraction of the rest
+DETAILED_LOG_MODE = os.environ.get('DETAILED_LOG_MODE', 'full')
+DETAILED_LOG_SAMPLE_FIRST = int(os.environ.get('DETAILED_LOG_SAMPLE_FIRST', '10'))
+DETAILED_LOG_SAMPLE_RATE = float(os.environ.get('DETAILED_LOG_SAMPLE_RATE', '1.0'))
+
+DETAILED_LOG_LEVELS = {'off': logging.WARNING, 'summary': logging.DEBUG, 'full': logging.DEBUG}
+PYNETDICOM_LOG_LEVELS = {'off': logging.WARNING, 'summary': logging.INFO, 'full': logging.DEBUG}
+if DETAILED_LOG_MODE not in DETAILED_LOG_LEVELS:
+    raise ValueError(f"DETAILED_LOG_MODE must be one of {', '.join(DETAILED_LOG_LEVELS)}, not {DETAILED_LOG_MODE!r}")
+
+# Asynchronous logging: handlers only enqueue records and a listener thread
+# formats and writes them in batches, so association threads never block on I/O.
+# LOG_QUEUE_POLICY is "drop" (discard when full) or "block" (wait up to
+# LOG_QUEUE_BLOCK_TIMEOUT seconds for space, then discard).
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_QUEUE_POLICY = os.environ.get('LOG_QUEUE_POLICY', 'drop')
+LOG_QUEUE_BLOCK_TIMEOUT = float(os.environ.get('LOG_QUEUE_BLOCK_TIMEOUT', '1.0'))
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', '256'))
+LOG_DROP_REPORT_INTERVAL = 60
+
+# Rotated logs are compressed by a background thread when LOG_COMPRESSION is
+# "gzip" ("none" keeps them as they are) and removed after LOG_RETENTION_DAYS
+# days (0 keeps them forever)
+LOG_COMPRESSION = os.environ.get('LOG_COMPRESSION', 'gzip')
+LOG_COMPRESSION_LEVEL = int(os.environ.get('LOG_COMPRESSION_LEVEL', '6'))
+LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', '30'))
+# Seconds a rotated file is kept next to its .gz. Removing it at once would
+# free its inode for the next new file while readers may still hold offsets
+# into it, and the log server tells files apart by inode
+LOG_COMPRESSED_GRACE = 300
+if LOG_COMPRESSION not in ('gzip', 'none'):
+    raise ValueError(f"LOG_COMPRESSION must be gzip or none, not {LOG_COMPRESSION!r}")
+
+# Listener processes, see start_dicom_server. Worker processes share this
+# process's log listener through a multiprocessing queue, so all of them write
+# to the same log files
+DICOM_WORKERS = int(os.environ.get('DICOM_WORKERS', '1'))
+
+if DICOM_WORKERS > 1:
+    log_queue = multiprocessing.get_context('fork').Queue(LOG_QUEUE_SIZE)
+else:
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+log_stats_lock = threading.Lock()
+# Records written and dropped (per logger name) by the pipeline in this process
+log_queue_stats = {"written": 0, "dropped": {}}
+# Records dropped by any process, per routed logger. Shared memory counters
+# created before the workers are forked, so the listener can report drops
+# made in the workers too
+log_drop_counters = {}
+log_listener_thread = None
+# Handlers of each queue handler, by name: queued records only carry the name,
+# which can be sent between processes
+log_targets = {}
+
+class BatchFlushMixin:
+    # Set by the log listener while it writes a batch, so each batch is flushed once
+    in_batch = False
+
+    def flush(self):
+        if not self.in_batch:
+            super().flush()
+
+class BatchedTimedRotatingFileHandler(BatchFlushMixin, TimedRotatingFileHandler):
+    pass
+
+class BatchedStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    pass
+
+# Serialises dict messages to JSON in the listener thread instead of the caller's
+class JsonMessageFormatter(logging.Formatter):
+    def format(self, record):
+        if isinstance(record.msg, dict):
+            # Serialised once per record, however many handlers write it
+            if not hasattr(record, 'json_message'):
+                try:
+                    record.json_message = json.dumps(record.msg)
+                except (TypeError, ValueError) as e:
+                    exception_logger.error(f"Failed to log simplified message: {record.msg} - {e}")
+                    record.json_message = json.dumps(record.msg, default=str)
+            return record.json_message
+        return super().format(record)
+
+# Queues records for the listener together with the name of the handlers
+# that write them
+class BoundedQueueHandler(QueueHandler):
+    def __init__(self, target, drop_counter):
+        super().__init__(log_queue)
+        self.target = target
+        self.drop_counter = drop_counter
+
+    def prepare(self, record):
+        # Resolve arguments and tracebacks now, they may change once the caller returns
+        if record.args or record.exc_info:
+            record = copy.copy(record)
+            if record.args:
+                record.msg = record.getMessage()
+                record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        item = (self.target, record)
+        try:
+            # The listener itself must never wait on its own queue
+            if LOG_QUEUE_POLICY == 'block' and threading.current_thread() is not log_listener_thread:
+                self.queue.put(item, timeout=LOG_QUEUE_BLOCK_TIMEOUT)
+            else:
+                self.queue.put_nowait(item)
+        except queue.Full:
+            with log_stats_lock:
+                dropped = log_queue_stats["dropped"]
+                dropped[record.name] = dropped.get(record.name, 0) + 1
+            with self.drop_counter.get_lock():
+                self.drop_counter.value += 1
+
+def write_log_batch(batch):
+    batch_handlers = []
+    for target, record in batch:
+        for handler in log_targets[target]:
+            if not handler.in_batch:
+                handler.in_batch = True
+                batch_handlers.append(handler)
+            handler.handle(record)
+    for handler in batch_handlers:
+        handler.in_batch = False
+        handler.flush()
+    log_queue_stats["written"] += len(batch)
+
+def log_listener_loop():
+    reported_drops = 0
+    last_report = 0
+    while True:
+        item = log_queue.get()
+        batch = []
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= LOG_BATCH_SIZE:
+                break
+            try:
+                item = log_queue.get_nowait()
+            except queue.Empty:
+                break
+        write_log_batch(batch)
+        if item is None:
+            # Write records produced while writing the final batch, then stop
+            batch = []
+            while True:
+                try:
+                    item = log_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    batch.append(item)
+            write_log_batch(batch)
+            return
+        dropped = {name: counter.value for name, counter in log_drop_counters.items() if counter.value}
+        drops = sum(dropped.values())
+        if drops > reported_drops and time.monotonic() - last_report >= LOG_DROP_REPORT_INTERVAL:
+            reported_drops, last_report = drops, time.monotonic()
+            exception_logger.error(f"Log queue full, dropped {drops} records so far: {dropped}")
+
+def start_log_listener():
+    global log_listener_thread
+    log_listener_thread = threading.Thread(target=log_listener_loop, name='log-listener', daemon=True)
+    log_listener_thread.start()
+
+# Drain whatever is still queued before the interpreter exits
+def stop_log_listener():
+    if log_listener_thread is not None and log_listener_thread.is_alive():
+        log_queue.put(None)
+        log_listener_thread.join(timeout=10)
+
+# Replace a logger's handlers with a queue handler feeding the handlers of
+# target from the listener
+def route_through_log_queue(logger, target, handlers=None):
+    if handlers is not None:
+        for handler in handlers:
+            if not isinstance(handler, BatchFlushMixin):
+                handler.in_batch = False
+        log_targets[target] = handlers
+    if logger.name not in log_drop_counters:
+        log_drop_counters[logger.name] = multiprocessing.get_context('fork').Value('q', 0)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(BoundedQueueHandler(target, log_drop_counters[logger.name]))
+
+# Rotated log files are "<log>.%Y%m%d", with ".gz" once compressed
+rotated_log_pattern = re.compile(r'\.(\d{8})(\.gz)?$')
+log_archive_queue = queue.Queue()
+log_archive_thread = None
+
+# Rename the live file as usual and leave compression to the archive thread,
+# so the log listener is not held up for the length of a whole day's log
+def rotate_log_file(source, dest):
+    if os.path.exists(source):
+        os.rename(source, dest)
+        log_archive_queue.put(dest)
+
+# Compressing a rotated file replaces it with a new inode, so readers holding
+# an offset into the old one could not find it again. "<log>.rotations.json"
+# maps the inode of each compressed file to its .gz and the decompressed offset
+# its content starts at; the log server resumes cursors from it. `inodes` maps
+# the inodes compressed into path's .gz to their offsets
+def load_rotations(log_file):
+    try:
+        with open(f"{log_file}.rotations.json", 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        exception_logger.error(f"Ignoring unreadable rotation record of {log_file}: {e}")
+        return {}
+
+def record_rotation(path, inodes):
+    log_file = path[:rotated_log_pattern.search(path).start()]
+    rotations_path = f"{log_file}.rotations.json"
+    rotations = load_rotations(log_file)
+    directory = os.path.dirname(path)
+    # Forget files removed by retention
+    rotations = {
+        key: rotation for key, rotation in rotations.items()
+        if os.path.exists(os.path.join(directory, rotation["segment"]))
+    }
+    for inode, base in inodes.items():
+        rotations[str(inode)] = {"segment": f"{os.path.basename(path)}.gz", "base": base}
+    tmp_path = f"{rotations_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(rotations, f)
+    os.replace(tmp_path, rotations_path)
+
+# Compress one rotated file next to itself. Readers see either the plain file
+# or the finished .gz, never a partial one. A restart can rotate to a date that
+# was already archived; the new file is then appended as a second gzip member
+def compress_log_file(path):
+    gz_path = f"{path}.gz"
+    tmp_path = f"{gz_path}.tmp"
+    try:
+        inodes = {}
+        base = 0
+        with open(tmp_path, 'wb') as raw:
+            if os.path.exists(gz_path):
+                # The existing .gz is replaced too, its content stays at the start
+                inodes[os.stat(gz_path).st_ino] = 0
+                with open(gz_path, 'rb') as archived:
+                    shutil.copyfileobj(archived, raw, 1 << 20)
+                with gzip.open(gz_path, 'rb') as archived:
+                    while True:
+                        chunk = archived.read(1 << 20)
+                        if not chunk:
+                            break
+                        base += len(chunk)
+            with open(path, 'rb') as source, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=LOG_COMPRESSION_LEVEL) as dest:
+                shutil.copyfileobj(source, dest, 1 << 20)
+        inodes[os.stat(path).st_ino] = base
+        # Recorded before the .gz appears, so a reader never sees one without the other
+        record_rotation(path, inodes)
+        os.replace(tmp_path, gz_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        exception_logger.error(f"Failed to compress rotated log {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+# Whether a rotated plain file has already been compressed into its .gz
+def is_compressed(path, rotations):
+    try:
+        rotation = rotations.get(str(os.stat(path).st_ino))
+    except FileNotFoundError:
+        return False
+    return rotation is not None and rotation["segment"] == f"{os.path.basename(path)}.gz" and os.path.exists(f"{path}.gz")
+
+# Compress rotated files left behind by earlier runs, remove compressed ones
+# after LOG_COMPRESSED_GRACE and expired ones
+def archive_rotated_logs(compress=True):
+    cutoff = (datetime.now() - timedelta(days=LOG_RETENTION_DAYS)).strftime('%Y%m%d')
+    for log_file in (log_file_path, simplified_log_file_path, exception_log_file_path):
+        rotations = load_rotations(log_file)
+        for path in sorted(glob.glob(log_file + '.*')):
+            match = rotated_log_pattern.search(path[len(log_file):])
+            if match is None:
+                continue
+            if LOG_RETENTION_DAYS > 0 and match.group(1) < cutoff:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    exception_logger.error(f"Failed to remove expired log {path}: {e}")
+            elif match.group(2) is None and is_compressed(path, rotations):
+                try:
+                    if time.time() - os.stat(f"{path}.gz").st_mtime >= LOG_COMPRESSED_GRACE:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    exception_logger.error(f"Failed to remove compressed log {path}: {e}")
+            elif compress and LOG_COMPRESSION == 'gzip' and match.group(2) is None:
+                compress_log_file(path)
+
+def log_archive_loop():
+    archive_rotated_logs()
+    while True:
+        try:
+            path = log_archive_queue.get(timeout=LOG_COMPRESSED_GRACE)
+        except queue.Empty:
+            archive_rotated_logs(compress=False)
+            continue
+        if path is None:
+            return
+        if LOG_COMPRESSION == 'gzip':
+            compress_log_file(path)
+        archive_rotated_logs(compress=False)
+
+def start_log_archiver():
+    global log_archive_thread
+    log_archive_thread = threading.Thread(target=log_archive_loop, name='log-archiver', daemon=True)
+    log_archive_thread.start()
 
 # Logger setup function
 def setup_logger(name, log_file, level=logging.INFO, when="midnight", interval=1):
-    handler = TimedRotatingFileHandler(log_file, when=when, interval=interval)
+    handler = BatchedTimedRotatingFileHandler(log_file, when=when, interval=interval)
     handler.suffix = "%Y%m%d"
+    handler.rotator = rotate_log_file
+    stream_handler = BatchedStreamHandler()
+    for h in (handler, stream_handler):
+        h.setFormatter(JsonMessageFormatter())
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(handler)
-    logger.addHandler(logging.StreamHandler())
+    route_through_log_queue(logger, name, [handler, stream_handler])
     return logger
 
-detailed_logger = setup_logger('detailed_logger', log_file_path, logging.DEBUG)
-simplified_logger = setup_logger('simplified_logger', simplified_log_file_path)
-exception_logger = setup_logger('exception_logger', exception_log_file_path, logging.ERROR)
+# Handlers are attached by setup_logging, called from main
+detailed_logger = logging.getLogger('detailed_logger')
+simplified_logger = logging.getLogger('simplified_logger')
+exception_logger = logging.getLogger('exception_logger')
+pynetdicom_logger = logging.getLogger('pynetdicom')
+
+PDU_DUMP_HANDLERS = [
+    (evt.EVT_DIMSE_RECV, standard_dimse_recv_handler),
+    (evt.EVT_DIMSE_SENT, standard_dimse_sent_handler),
+    (evt.EVT_PDU_RECV, standard_pdu_recv_handler),
+    (evt.EVT_PDU_SENT, standard_pdu_sent_handler),
+]
 
-# Configure pynetdicom debug logging to use the detailed logger
-debug_logger()
+# Associations seen per peer address, used to sample full PDU dumps
+peer_association_counts = {}
+PEER_ASSOCIATION_COUNTS_LIMIT = 100000
 
-# Ensure that pynetdicom messages are captured
-pynetdicom_logger = logging.getLogger('pynetdicom')
-pynetdicom_logger.setLevel(logging.DEBUG)
-pynetdicom_logger.addHandler(logging.FileHandler(log_file_path))
+# Drops pynetdicom DEBUG records (identifier dumps etc.) raised on the threads
+# of associations that were not sampled for full dumps
+class SampledAssociationFilter(logging.Filter):
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        thread = threading.current_thread()
+        # DUL reader threads point back to their association
+        assoc = getattr(thread, 'assoc', thread)
+        return getattr(assoc, 'dump_pdus', True)
+
+# Open the log files and start the log listener and archiver
+def setup_logging():
+    os.makedirs(log_directory, exist_ok=True)
+    os.makedirs(simplified_log_directory, exist_ok=True)
+    start_log_listener()
+    atexit.register(stop_log_listener)
+    start_log_archiver()
+
+    setup_logger('detailed_logger', log_file_path, DETAILED_LOG_LEVELS[DETAILED_LOG_MODE])
+    setup_logger('simplified_logger', simplified_log_file_path)
+    setup_logger('exception_logger', exception_log_file_path, logging.ERROR)
+
+    # Ensure that pynetdicom messages are captured, written once through the
+    # detailed logger's own rotating file and stream handlers
+    pynetdicom_logger.setLevel(PYNETDICOM_LOG_LEVELS[DETAILED_LOG_MODE])
+    pynetdicom_logger.propagate = False
+    route_through_log_queue(pynetdicom_logger, 'detailed_logger')
+    if DETAILED_LOG_MODE == 'full':
+        pynetdicom_logger.handlers[0].addFilter(SampledAssociationFilter())
+
+    # pynetdicom would format PDU and DIMSE dumps for every association; they are
+    # bound only to the sampled associations in handle_conn_open instead
+    _config.LOG_HANDLER_LEVEL = "none"
+    _config.LOG_REQUEST_IDENTIFIERS = DETAILED_LOG_MODE == 'full'
+    _config.LOG_RESPONSE_IDENTIFIERS = DETAILED_LOG_MODE == 'full'
 
-# Function to log valid JSON messages
+def should_dump_association(address):
+    if len(peer_association_counts) >= PEER_ASSOCIATION_COUNTS_LIMIT:
+        peer_association_counts.clear()
+    count = peer_association_counts.get(address, 0)
+    peer_association_counts[address] = count + 1
+    return count < DETAILED_LOG_SAMPLE_FIRST or random.random() < DETAILED_LOG_SAMPLE_RATE
+
+# Session and event IDs: microsecond timestamps, bumped past the last ID
+# handed out so that concurrent associations never share one. Worker process
+# i of DICOM_WORKERS only hands out IDs equal to i modulo DICOM_WORKERS
+event_id_lock = threading.Lock()
+last_event_id = 0
+event_id_offset = 0
+
+def next_event_id():
+    global last_event_id
+    with event_id_lock:
+        event_id = max(int(time.time() * 1000000), last_event_id + 1)
+        event_id += (event_id_offset - event_id) % DICOM_WORKERS
+        last_event_id = event_id
+        return str(event_id)
+
+# Function to log valid JSON messages, serialised by the log listener
 def log_simplified_message(message):
-    try:
-        if message.get("event") == "Created fake DICOM file":
-            return
-        json_message = json.dumps(message)
-        simplified_logger.info(json_message)
-    except (TypeError, ValueError) as e:
-        exception_logger.error(f"Failed to log simplified message: {message} - {e}")
+    if message.get("event") == "Created fake DICOM file":
+        return
+    simplified_logger.info(message)
 
 # Function to generate fake DICOM files with Danish-like names
 def create_fake_dicom_files(directory, num_files=10):
@@ -101,44 +532,790 @@ def create_fake_dicom_files(directory, num_files=10):
         pydicom.dcmwrite(filename, ds)
         detailed_logger.info(f"Created fake DICOM file: {filename}")
         log_simplified_message({
-            "ID": str(int(time.time() * 1000000)),
+            "ID": next_event_id(),
             "event": "Created fake DICOM file",
             "file": filename,
             "timestamp": datetime.now().isoformat()
         })
 
-# Function to scan and load DICOM files
-def load_dicom_files(directory):
-    dicom_files = {}
+# Attributes kept in memory for each archived instance. Only these are read
+# at startup; pixel data stays on disk until a C-GET needs the whole file.
+CATALOG_KEYWORDS = [
+    'PatientName', 'PatientID', 'PatientBirthDate', 'PatientSex',
+    'StudyInstanceUID', 'StudyDate', 'StudyTime', 'StudyID', 'AccessionNumber',
+    'StudyDescription', 'ReferringPhysicianName',
+    'SeriesInstanceUID', 'SeriesNumber', 'Modality',
+    'SOPClassUID', 'SOPInstanceUID', 'InstanceNumber',
+]
+
+# Read the catalog record of one file: its header attributes as strings
+def read_catalog_record(path):
+    ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=CATALOG_KEYWORDS)
+    record = {keyword: str(ds.get(keyword, '') or '') for keyword in CATALOG_KEYWORDS}
+    record['TransferSyntaxUID'] = str(ds.file_meta.get('TransferSyntaxUID', ImplicitVRLittleEndian))
+    if not record['SOPClassUID'] and 'MediaStorageSOPClassUID' in ds.file_meta:
+        record['SOPClassUID'] = str(ds.file_meta.MediaStorageSOPClassUID)
+    if not record['SOPInstanceUID'] and 'MediaStorageSOPInstanceUID' in ds.file_meta:
+        record['SOPInstanceUID'] = str(ds.file_meta.MediaStorageSOPInstanceUID)
+    return record
+
+# Build a pixel-free dataset from a catalog record, e.g. for C-FIND responses
+def record_to_dataset(record):
+    ds = Dataset()
+    for keyword in CATALOG_KEYWORDS:
+        if record[keyword]:
+            setattr(ds, keyword, record[keyword])
+    return ds
+
+# Read a whole instance, pixel data included, only when it has to be sent
+def load_instance(path):
+    ds = pydicom.dcmread(path)
+    if 'SOPClassUID' not in ds and 'MediaStorageSOPClassUID' in ds.file_meta:
+        ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+    return ds
+
+# Header-only stand-in for an archived file, yielded for C-GET sub-operations.
+# pynetdicom only reads its UIDs to pick a presentation context; the bytes sent
+# are produced by encode_with_cache from archive_path
+class ArchivedInstance(Dataset):
+    def __init__(self, path, record):
+        super().__init__(record_to_dataset(record))
+        self.archive_path = path
+        self.file_meta = FileMetaDataset()
+        self.file_meta.TransferSyntaxUID = record['TransferSyntaxUID']
+
+# Encoded instances sent by C-GET are kept in an LRU cache bounded by total
+# size (ENCODED_CACHE_BYTES), so repeated retrievals skip reading and encoding
+ENCODED_CACHE_BYTES = int(os.environ.get('ENCODED_CACHE_BYTES', str(256 * 1024 * 1024)))
+
+class EncodedCache:
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            bytestream = self.entries.get(key)
+            if bytestream is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return bytestream
+
+    def put(self, key, bytestream):
+        # One instance may take at most a quarter of the budget
+        if len(bytestream) > self.budget // 4:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = bytestream
+            self.size += len(bytestream)
+            while self.size > self.budget:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+encoded_cache = EncodedCache(ENCODED_CACHE_BYTES)
+
+# Association.send_c_store encodes every dataset with association.encode, which
+# main replaces with encode_with_cache. For an ArchivedInstance the bytes come
+# from the cache or, when the file's transfer syntax matches the negotiated one,
+# straight from the file body without parsing
+_pynetdicom_encode = pynetdicom.association.encode
+
+def encode_with_cache(ds, is_implicit_vr, is_little_endian, deflated=False):
+    path = getattr(ds, 'archive_path', None)
+    if path is None:
+        return _pynetdicom_encode(ds, is_implicit_vr, is_little_endian, deflated)
+    try:
+        key = (path, os.stat(path).st_mtime_ns, is_implicit_vr, is_little_endian, deflated)
+        bytestream = encoded_cache.get(key)
+        if bytestream is not None:
+            return bytestream
+        syntax = UID(ds.file_meta.TransferSyntaxUID)
+        if (not deflated and not syntax.is_deflated and syntax.is_transfer_syntax
+                and syntax.is_implicit_VR == is_implicit_vr and syntax.is_little_endian == is_little_endian):
+            _, offset = split_dataset(path)
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                bytestream = f.read()
+        else:
+            bytestream = _pynetdicom_encode(load_instance(path), is_implicit_vr, is_little_endian, deflated)
+    except Exception as e:
+        detailed_logger.error(f"Failed to encode DICOM file {path}: {e}")
+        return None
+    if bytestream is not None:
+        encoded_cache.put(key, bytestream)
+    return bytestream
+
+# Catalog loading: changed files are parsed across CATALOG_WORKERS processes
+# and the records cached on disk, keyed by path, mtime and size, so restarts
+# only re-read files that changed
+CATALOG_WORKERS = int(os.environ.get('CATALOG_WORKERS', str(os.cpu_count() or 1)))
+CATALOG_CACHE_FILE = '.catalog_cache.json'
+CATALOG_CACHE_VERSION = 2
+# Below this many changed files a process pool costs more than it saves
+CATALOG_PARALLEL_THRESHOLD = 64
+
+def scan_catalog_file(path):
+    try:
+        return path, read_catalog_record(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+def load_catalog_cache(cache_path):
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        detailed_logger.error(f"Ignoring unreadable catalog cache {cache_path}: {e}")
+        return {}
+    if cache.get("version") != CATALOG_CACHE_VERSION or cache.get("keywords") != CATALOG_KEYWORDS:
+        return {}
+    return cache["entries"]
+
+def save_catalog_cache(cache_path, entries):
+    # Worker processes may save at the same time, each through its own file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": CATALOG_CACHE_VERSION, "keywords": CATALOG_KEYWORDS, "entries": entries}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        detailed_logger.error(f"Failed to save catalog cache {cache_path}: {e}")
+
+def parse_catalog_files(paths, parallel=True):
+    if not parallel or len(paths) < CATALOG_PARALLEL_THRESHOLD or CATALOG_WORKERS <= 1:
+        return map(scan_catalog_file, paths)
+    # Workers only parse and return results, all logging stays in this process
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=CATALOG_WORKERS, mp_context=context) as executor:
+        chunksize = max(1, min(256, len(paths) // (CATALOG_WORKERS * 4)))
+        return list(executor.map(scan_catalog_file, paths, chunksize=chunksize))
+
+# Function to scan DICOM files into catalog entries keyed by path: mtime, size
+# and the header-only record, None for a file that could not be read until it
+# changes again. Entries of `previous`, else of the on-disk cache, are reused
+# as they are for unchanged files
+def load_dicom_files(directory, previous=None, parallel=True):
+    started = time.monotonic()
+    cache_path = os.path.join(directory, CATALOG_CACHE_FILE)
+    cached = load_catalog_cache(cache_path) if previous is None else previous
+
+    entries = {}
+    changed = []
     for root, _, files in os.walk(directory):
         for file in files:
             if file.endswith('.dcm'):
                 path = os.path.join(root, file)
                 try:
-                    ds = pydicom.dcmread(path)
-                    dicom_files[path] = ds
-                except Exception as e:
-                    detailed_logger.error(f"Failed to read DICOM file {path}: {e}")
-                    log_simplified_message({
-                        "ID": str(int(time.time() * 1000000)),
-                        "event": "Failed to read DICOM file",
-                        "file": path,
-                        "error": str(e),
-                        "timestamp": datetime.now().isoformat()
-                    })
-    return dicom_files
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entry = cached.get(path)
+                if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                    entries[path] = entry
+                else:
+                    entries[path] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "record": None}
+                    changed.append(path)
+
+    reused = len(entries) - len(changed)
+    for path, record, error in parse_catalog_files(changed, parallel):
+        entries[path]["record"] = record
+        if error is None:
+            continue
+        detailed_logger.error(f"Failed to read DICOM file {path}: {error}")
+        log_simplified_message({
+            "ID": next_event_id(),
+            "event": "Failed to read DICOM file",
+            "file": path,
+            "error": error,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    if changed or len(entries) != len(cached):
+        save_catalog_cache(cache_path, entries)
+
+    if previous is None:
+        elapsed = time.monotonic() - started
+        detailed_logger.info(
+            f"Loaded {sum(entry['record'] is not None for entry in entries.values())} DICOM files from {directory} in {elapsed:.2f}s "
+            f"({len(changed)} parsed, {reused} cached, "
+            f"{len(changed) / elapsed if elapsed else 0:.0f} files/s parsed)"
+        )
+    return entries
+
+# Attributes indexed for C-FIND matching
+INDEXED_KEYWORDS = ['PatientName', 'PatientID', 'StudyInstanceUID', 'Modality', 'StudyDate']
+# Attributes whose query values are DICOM date ranges
+DATE_KEYWORDS = {'StudyDate', 'PatientBirthDate'}
+
+@functools.lru_cache(maxsize=1024)
+def wildcard_pattern(value):
+    return re.compile(''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in value), re.DOTALL)
+
+# Parse one query value into (kind, test, operand), or None for a universal
+# match. test(value) applies DICOM matching to one record value; kind and
+# operand let the index look the matches up instead: 'list' with the accepted
+# values, 'range' with (start, end), 'wildcard' with the literal prefix, and
+# 'single' with the value
+def parse_query_value(keyword, query):
+    if isinstance(query, (list, MultiValue)):
+        accepted = {str(item) for item in query}
+        return 'list', lambda value: str(value) in accepted, accepted
+    query = str(query)
+    if query == '' or query.strip('*') == '':
+        return None
+    if keyword in DATE_KEYWORDS and '-' in query:
+        start, _, end = query.partition('-')
+        return 'range', lambda value: bool(value) and (not start or value >= start) and (not end or value <= end), (start, end)
+    if '*' in query or '?' in query:
+        pattern = wildcard_pattern(query)
+        return 'wildcard', lambda value: pattern.fullmatch(str(value)) is not None, re.split(r'[*?]', query, maxsplit=1)[0]
+    return 'single', lambda value: str(value) == query, query
+
+# (keyword, test) for the keys of a query that are not universal matches
+def query_tests(query):
+    tests = []
+    for keyword, value in query.items():
+        parsed = parse_query_value(keyword, value)
+        if parsed is not None:
+            tests.append((keyword, parsed[1]))
+    return tests
+
+# Whether a record passes every test; multi-valued record values match when
+# any of their values does
+def matches_query(tests, record):
+    for keyword, test in tests:
+        value = record.get(keyword, '')
+        if not any(test(item) for item in (value if isinstance(value, list) else [value])):
+            return False
+    return True
+
+# In-memory index of the archive for C-FIND matching. For each indexed
+# attribute it maps every distinct value to the set of archive keys holding it,
+# and keeps the distinct values sorted for prefix wildcard and date range
+# lookups, so a query costs time in the number of distinct values it touches
+# rather than the number of instances.
+class AttributeIndex:
+    def __init__(self, catalog):
+        self.order = {}
+        self.records = catalog
+        self.values = {keyword: {} for keyword in INDEXED_KEYWORDS}
+        for position, (key, record) in enumerate(catalog.items()):
+            self.order[key] = position
+            for keyword in INDEXED_KEYWORDS:
+                self.values[keyword].setdefault(record[keyword], set()).add(key)
+        self.next_position = len(self.order)
+        self.sorted_values = {keyword: sorted(values) for keyword, values in self.values.items()}
+
+    # A new index over `catalog`: this one without the `removed` keys and with
+    # the `added` records. Only the key sets that change are copied, the rest
+    # is shared with this index, which stays valid for requests still using it
+    def updated(self, catalog, removed, added):
+        index = copy.copy(self)
+        index.records = catalog
+        index.order = dict(self.order)
+        index.values = {keyword: dict(values) for keyword, values in self.values.items()}
+        copied = set()
+        # Keywords that gained or lost distinct values need sorting again
+        resorted = set()
+
+        def keys_of(keyword, value):
+            values = index.values[keyword]
+            if (keyword, value) not in copied:
+                copied.add((keyword, value))
+                if value not in values:
+                    resorted.add(keyword)
+                values[value] = set(values.get(value, ()))
+            return values[value]
+
+        for key in removed:
+            del index.order[key]
+            for keyword in INDEXED_KEYWORDS:
+                value = self.records[key][keyword]
+                keys = keys_of(keyword, value)
+                keys.discard(key)
+                if not keys:
+                    del index.values[keyword][value]
+                    copied.discard((keyword, value))
+                    resorted.add(keyword)
+        for key, record in added.items():
+            index.order[key] = index.next_position
+            index.next_position += 1
+            for keyword in INDEXED_KEYWORDS:
+                keys_of(keyword, record[keyword]).add(key)
+        index.sorted_values = dict(self.sorted_values)
+        for keyword in resorted:
+            index.sorted_values[keyword] = sorted(index.values[keyword])
+        return index
+
+    # Return the archive keys matching every indexed key in `identifier`, in load order
+    def match(self, identifier):
+        matchers = []
+        for keyword in INDEXED_KEYWORDS:
+            value = identifier.get(keyword)
+            if value is not None:
+                matcher = self.parse_matcher(keyword, value)
+                if matcher is not None:
+                    matchers.append(matcher)
+        # Most selective first, by (estimated) number of matching instances
+        matchers.sort(key=lambda matcher: matcher[0])
+
+        candidates = None
+        for estimate, keyword, lookup, test in matchers:
+            if test is not None and candidates is not None and len(candidates) <= estimate:
+                # Checking the remaining candidates is cheaper than expanding
+                # a range or wildcard over the index
+                candidates = {key for key in candidates if test(self.records[key][keyword])}
+            else:
+                keys = lookup()
+                candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return []
+        if candidates is None:
+            return list(self.order)
+        return sorted(candidates, key=self.order.__getitem__)
 
+    # Return (estimate, keyword, lookup, test) for one query key, or None when
+    # the value is a universal match. `lookup()` returns the matching keys from
+    # the index; for ranges and wildcards `test(value)` checks one instance's
+    # value, see parse_query_value, and `estimate` is the expected number of
+    # matches.
+    def parse_matcher(self, keyword, value):
+        parsed = parse_query_value(keyword, value)
+        if parsed is None:
+            return None
+        kind, test, operand = parsed
+        values = self.values[keyword]
+        if kind == 'list':
+            keys = set().union(*(values.get(item, set()) for item in operand))
+            return (len(keys), keyword, lambda: keys, None)
+        if kind == 'single':
+            keys = values.get(operand, set())
+            return (len(keys), keyword, lambda: keys, None)
+        sorted_values = self.sorted_values[keyword]
+        if kind == 'range':
+            start, end = operand
+            low = bisect.bisect_left(sorted_values, start) if start else 0
+            high = bisect.bisect_right(sorted_values, end) if end else len(sorted_values)
+        else:
+            # Only values sharing the literal prefix can match
+            low = bisect.bisect_left(sorted_values, operand)
+            high = bisect.bisect_left(sorted_values, operand + '\U0010ffff') if operand else len(sorted_values)
+        lookup = lambda: set().union(*(values[candidate] for candidate in sorted_values[low:high] if test(candidate)))
+        return (self.estimate(keyword, high - low), keyword, lookup, test)
+
+    # Expected instances for `distinct` values of a keyword, assuming an even spread
+    def estimate(self, keyword, distinct):
+        return distinct * len(self.order) // max(1, len(self.values[keyword]))
+
+# Attributes of each query/retrieve level, as kept in the catalog
+PATIENT_LEVEL_KEYWORDS = ['PatientName', 'PatientID', 'PatientBirthDate', 'PatientSex']
+STUDY_LEVEL_KEYWORDS = [
+    'StudyInstanceUID', 'StudyDate', 'StudyTime', 'StudyID', 'AccessionNumber',
+    'StudyDescription', 'ReferringPhysicianName',
+]
+SERIES_LEVEL_KEYWORDS = ['SeriesInstanceUID', 'SeriesNumber', 'Modality']
+IMAGE_LEVEL_KEYWORDS = ['SOPClassUID', 'SOPInstanceUID', 'InstanceNumber']
+
+# For each QueryRetrieveLevel: the unique key, the unique keys of the levels
+# above it that every response carries, and the attributes a query may match
+# and return. Study records carry the patient attributes too, as Study Root
+# queries have no patient level
+QUERY_LEVELS = {
+    'PATIENT': ('PatientID', [], PATIENT_LEVEL_KEYWORDS + [
+        'NumberOfPatientRelatedStudies', 'NumberOfPatientRelatedSeries', 'NumberOfPatientRelatedInstances',
+    ]),
+    'STUDY': ('StudyInstanceUID', [], PATIENT_LEVEL_KEYWORDS + STUDY_LEVEL_KEYWORDS + [
+        'ModalitiesInStudy', 'NumberOfStudyRelatedSeries', 'NumberOfStudyRelatedInstances',
+    ]),
+    'SERIES': ('SeriesInstanceUID', ['StudyInstanceUID'], ['PatientID', 'StudyInstanceUID'] + SERIES_LEVEL_KEYWORDS + [
+        'NumberOfSeriesRelatedInstances',
+    ]),
+    'IMAGE': ('SOPInstanceUID', ['StudyInstanceUID', 'SeriesInstanceUID'], ['PatientID', 'StudyInstanceUID', 'SeriesInstanceUID'] + IMAGE_LEVEL_KEYWORDS),
+}
+# Attributes computed from the hierarchy, returned but never matched on
+COMPUTED_KEYWORDS = {
+    'NumberOfPatientRelatedStudies', 'NumberOfPatientRelatedSeries', 'NumberOfPatientRelatedInstances',
+    'NumberOfStudyRelatedSeries', 'NumberOfStudyRelatedInstances', 'NumberOfSeriesRelatedInstances',
+}
+# The UID of a single-UID query value, None for lists, wildcards and empty values
+def single_uid(value):
+    if not isinstance(value, str) or not value or '*' in value or '?' in value:
+        return None
+    return value
+
+# Patient/study/series/image hierarchy of the archive. Patient, study and
+# series records, with their related-instance counts, are computed once here;
+# image records are the catalog records themselves. Queries are matched on the
+# instance index where possible and answered level by level from these records
+class QueryHierarchy:
+    def __init__(self, catalog, index):
+        self.catalog = catalog
+        self.index = index
+        self.records = {'PATIENT': {}, 'STUDY': {}, 'SERIES': {}, 'IMAGE': catalog}
+        self.instances_by_uid = {}
+        self.series_instances = {}
+        self.patient_instances = {}
+        # Instances per transfer syntax of each SOP class, for storage_contexts
+        self.transfer_syntaxes = {}
+        for path, record in catalog.items():
+            self.instances_by_uid.setdefault(record['SOPInstanceUID'], path)
+            self.series_instances.setdefault(record['SeriesInstanceUID'], []).append(path)
+            self.patient_instances.setdefault(self.level_key('PATIENT', record), []).append(path)
+            syntaxes = self.transfer_syntaxes.setdefault(record['SOPClassUID'], {})
+            syntaxes[record['TransferSyntaxUID']] = syntaxes.get(record['TransferSyntaxUID'], 0) + 1
+        self.summarise(self.patient_instances)
+        self.storage_contexts = self.contexts()
+
+    # Presentation contexts to send this archive with, as (SOP class, transfer
+    # syntaxes) pairs: every SOP class, offered in the syntaxes its files are
+    # stored in, then the little endian ones
+    def contexts(self):
+        contexts = []
+        for sop_class, syntaxes in list(self.transfer_syntaxes.items())[:128]:
+            contexts.append((sop_class, tuple(syntaxes) + tuple(
+                syntax for syntax in (ExplicitVRLittleEndian, ImplicitVRLittleEndian) if syntax not in syntaxes
+            )))
+        return tuple(contexts)
+
+    # Compute the patient, study and series records of the given patients from
+    # their instances. A study is expected to belong to a single patient
+    def summarise(self, patient_keys):
+        patient_studies, patient_series, study_series = {}, {}, {}
+        for path in (path for patient_key in patient_keys for path in self.patient_instances[patient_key]):
+            record = self.catalog[path]
+            patient_key = self.level_key('PATIENT', record)
+            patient = self.records['PATIENT'].get(patient_key)
+            if patient is None:
+                patient = self.records['PATIENT'][patient_key] = {keyword: record[keyword] for keyword in PATIENT_LEVEL_KEYWORDS}
+                patient['NumberOfPatientRelatedInstances'] = 0
+            patient['NumberOfPatientRelatedInstances'] += 1
+            study = self.records['STUDY'].get(record['StudyInstanceUID'])
+            if study is None:
+                study = self.records['STUDY'][record['StudyInstanceUID']] = {
+                    keyword: record[keyword] for keyword in PATIENT_LEVEL_KEYWORDS + STUDY_LEVEL_KEYWORDS
+                }
+                study['ModalitiesInStudy'] = []
+                study['NumberOfStudyRelatedInstances'] = 0
+            study['NumberOfStudyRelatedInstances'] += 1
+            if record['Modality'] and record['Modality'] not in study['ModalitiesInStudy']:
+                study['ModalitiesInStudy'].append(record['Modality'])
+            series = self.records['SERIES'].get(record['SeriesInstanceUID'])
+            if series is None:
+                series = self.records['SERIES'][record['SeriesInstanceUID']] = {
+                    keyword: record[keyword] for keyword in ['PatientID', 'StudyInstanceUID'] + SERIES_LEVEL_KEYWORDS
+                }
+                series['NumberOfSeriesRelatedInstances'] = 0
+            series['NumberOfSeriesRelatedInstances'] += 1
+            patient_studies.setdefault(patient_key, set()).add(record['StudyInstanceUID'])
+            patient_series.setdefault(patient_key, set()).add(record['SeriesInstanceUID'])
+            study_series.setdefault(record['StudyInstanceUID'], set()).add(record['SeriesInstanceUID'])
+        for patient_key, studies in patient_studies.items():
+            patient = self.records['PATIENT'][patient_key]
+            patient['NumberOfPatientRelatedStudies'] = len(studies)
+            patient['NumberOfPatientRelatedSeries'] = len(patient_series[patient_key])
+        for study_uid, series in study_series.items():
+            study = self.records['STUDY'][study_uid]
+            study['ModalitiesInStudy'].sort()
+            study['NumberOfStudyRelatedSeries'] = len(series)
+
+    # A new hierarchy over `catalog` and `index` with the instances at the
+    # `removed` paths taken out and the `added` records put in. Only the
+    # patients they belong to are summarised again; this hierarchy is left
+    # as it was for requests still using it
+    def updated(self, catalog, index, removed, added):
+        removed = set(removed)
+        hierarchy = copy.copy(self)
+        hierarchy.catalog = catalog
+        hierarchy.index = index
+        hierarchy.records = {level: dict(records) for level, records in self.records.items()}
+        hierarchy.records['IMAGE'] = catalog
+        hierarchy.instances_by_uid = dict(self.instances_by_uid)
+        for path in removed:
+            uid = self.catalog[path]['SOPInstanceUID']
+            if hierarchy.instances_by_uid.get(uid) == path:
+                del hierarchy.instances_by_uid[uid]
+        for path, record in added.items():
+            hierarchy.instances_by_uid.setdefault(record['SOPInstanceUID'], path)
+
+        hierarchy.transfer_syntaxes = dict(self.transfer_syntaxes)
+        copied = set()
+        for record, change in [(self.catalog[path], -1) for path in removed] + [(record, 1) for record in added.values()]:
+            sop_class, syntax = record['SOPClassUID'], record['TransferSyntaxUID']
+            if sop_class not in copied:
+                copied.add(sop_class)
+                hierarchy.transfer_syntaxes[sop_class] = dict(hierarchy.transfer_syntaxes.get(sop_class, {}))
+            syntaxes = hierarchy.transfer_syntaxes[sop_class]
+            syntaxes[syntax] = syntaxes.get(syntax, 0) + change
+            if not syntaxes[syntax]:
+                del syntaxes[syntax]
+                if not syntaxes:
+                    del hierarchy.transfer_syntaxes[sop_class]
+                    copied.discard(sop_class)
+        hierarchy.storage_contexts = hierarchy.contexts()
+
+        groupings = [
+            ('series_instances', lambda record: record['SeriesInstanceUID']),
+            ('patient_instances', lambda record: self.level_key('PATIENT', record)),
+        ]
+        for attribute, group_key in groupings:
+            groups = dict(getattr(self, attribute))
+            touched = {}
+            for path in removed:
+                touched.setdefault(group_key(self.catalog[path]), [])
+            for path, record in added.items():
+                touched.setdefault(group_key(record), []).append(path)
+            for key, paths in touched.items():
+                paths = [path for path in groups.get(key, ()) if path not in removed] + paths
+                if paths:
+                    groups[key] = paths
+                else:
+                    groups.pop(key, None)
+            setattr(hierarchy, attribute, groups)
+
+        # Drop the records of every patient touched, then summarise those left
+        patient_keys = {self.level_key('PATIENT', self.catalog[path]) for path in removed}
+        patient_keys.update(self.level_key('PATIENT', record) for record in added.values())
+        for patient_key in patient_keys:
+            hierarchy.records['PATIENT'].pop(patient_key, None)
+            for path in self.patient_instances.get(patient_key, ()):
+                record = self.catalog[path]
+                hierarchy.records['STUDY'].pop(record['StudyInstanceUID'], None)
+                hierarchy.records['SERIES'].pop(record['SeriesInstanceUID'], None)
+        hierarchy.summarise([patient_key for patient_key in patient_keys if patient_key in hierarchy.patient_instances])
+        return hierarchy
+
+    # Key of the level record an instance belongs to. Patients without an ID
+    # are told apart by name
+    def level_key(self, level, record):
+        if level == 'IMAGE':
+            return None
+        if level == 'PATIENT':
+            return record['PatientID'] or f"^{record['PatientName']}"
+        return record[QUERY_LEVELS[level][0]]
+
+    # Yield (key, record) for the records of `level` matching the identifier,
+    # lazily and in archive order
+    def match(self, level, identifier):
+        unique_keyword, _, keywords = QUERY_LEVELS[level]
+        query = {
+            keyword: identifier.get(keyword) for keyword in keywords
+            if keyword not in COMPUTED_KEYWORDS and identifier.get(keyword) is not None
+        }
+        records = self.records[level]
+        unique = single_uid(query.get(unique_keyword)) if unique_keyword != 'PatientID' else None
+        series_uid = single_uid(query.get('SeriesInstanceUID')) if level == 'IMAGE' else None
+        if unique is not None:
+            # A single UID: look the record up instead of going through the index
+            key = self.instances_by_uid.get(unique) if level == 'IMAGE' else unique
+            candidates = [key] if key in records else []
+            remaining = query
+        elif series_uid is not None:
+            candidates = self.series_instances.get(series_uid, [])
+            remaining = query
+        else:
+            indexed = {keyword: identifier.get(keyword) for keyword in INDEXED_KEYWORDS}
+            if level in ('PATIENT', 'STUDY'):
+                # A study matches a modality when any of its series has it
+                indexed['Modality'] = None
+                modalities = identifier.get('ModalitiesInStudy')
+                if modalities is not None and isinstance(modalities, str):
+                    indexed['Modality'] = modalities
+            if any(value is not None and self.index.parse_matcher(keyword, value) is not None for keyword, value in indexed.items()):
+                candidates = self.group(level, self.index.match(indexed))
+            else:
+                # Nothing to narrow down on the index (e.g. PatientName=*): walk
+                # the level's own records instead of every instance
+                candidates = iter(records)
+            remaining = {keyword: value for keyword, value in query.items() if keyword not in indexed or indexed[keyword] is None}
+        tests = query_tests(remaining)
+        for key in candidates:
+            record = records[key]
+            if matches_query(tests, record):
+                yield key, record
+
+    # Level keys of the given instances, first appearance first
+    def group(self, level, paths):
+        if level == 'IMAGE':
+            yield from paths
+            return
+        seen = set()
+        for path in paths:
+            key = self.level_key(level, self.catalog[path])
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+    # Archive paths of the instances a C-GET or C-MOVE identifier selects at its
+    # QueryRetrieveLevel, honouring series and instance UIDs as well as the index
+    def match_instances(self, identifier):
+        level = str(identifier.get('QueryRetrieveLevel', 'IMAGE')).upper()
+        series_uid = single_uid(identifier.get('SeriesInstanceUID')) if level in ('SERIES', 'IMAGE') else None
+        if series_uid is not None:
+            # A single series: check its instances rather than the whole index
+            tests = query_tests({keyword: identifier.get(keyword) for keyword in INDEXED_KEYWORDS if identifier.get(keyword) is not None})
+            paths = [path for path in self.series_instances.get(series_uid, []) if matches_query(tests, self.catalog[path])]
+        else:
+            paths = self.index.match(identifier)
+        tests = query_tests({
+            keyword: identifier.get(keyword) for keyword in ('SeriesInstanceUID', 'SOPInstanceUID')
+            if identifier.get(keyword) is not None and (level in ('SERIES', 'IMAGE') if keyword == 'SeriesInstanceUID' else level == 'IMAGE')
+        })
+        if tests:
+            paths = [path for path in paths if matches_query(tests, self.catalog[path])]
+        return paths
+
+    # Response identifier: QueryRetrieveLevel, the unique keys of this level and
+    # the levels above, and every requested return key, filled in where known
+    def response(self, level, record, identifier):
+        unique_keyword, parent_keywords, keywords = QUERY_LEVELS[level]
+        ds = Dataset()
+        for elem in identifier:
+            if elem.keyword == 'QueryRetrieveLevel':
+                continue
+            value = record.get(elem.keyword) if elem.keyword in keywords else None
+            if value in (None, '', []):
+                ds[elem.tag] = DataElement(elem.tag, elem.VR, [] if elem.VR == 'SQ' else None)
+            else:
+                setattr(ds, elem.keyword, value)
+        for keyword in parent_keywords + [unique_keyword]:
+            if keyword not in ds or ds[keyword].value in (None, ''):
+                if record.get(keyword):
+                    setattr(ds, keyword, record[keyword])
+        ds.QueryRetrieveLevel = level
+        return ds
+
+# The decoy archive. query_hierarchy holds the catalog, its index and the
+# query hierarchy as one snapshot: handlers read it once per request, and the
+# archive watcher replaces it in a single assignment, so a request never sees
+# half an update. archive_entries are the catalog entries it was built from
 dicom_directory = 'dicom_files'
-if not os.path.exists(dicom_directory):
-    create_fake_dicom_files(dicom_directory)
-dicom_datasets = load_dicom_files(dicom_directory)
+# Seconds between rescans of the archive directory, 0 disables. A rescan
+# stats every file, about a second per 200,000 files
+ARCHIVE_WATCH_INTERVAL = float(os.environ.get('ARCHIVE_WATCH_INTERVAL', '10'))
+
+archive_entries = {}
+query_hierarchy = QueryHierarchy({}, AttributeIndex({}))
+
+def archive_catalog(entries):
+    return {path: entry["record"] for path, entry in entries.items() if entry["record"] is not None}
+
+def load_archive():
+    global archive_entries, query_hierarchy
+    if not os.path.exists(dicom_directory):
+        create_fake_dicom_files(dicom_directory)
+    archive_entries = load_dicom_files(dicom_directory)
+    catalog = archive_catalog(archive_entries)
+    query_hierarchy = QueryHierarchy(catalog, AttributeIndex(catalog))
+
+# Rescan the archive directory and swap in a snapshot with the files added,
+# changed and removed since the last scan. Associations keep serving from the
+# snapshot they started with
+def reload_archive():
+    global archive_entries, query_hierarchy
+    if not os.path.isdir(dicom_directory):
+        return
+    started = time.monotonic()
+    previous = archive_entries
+    # Parsed in this thread: forking a parser pool from a serving process
+    # could copy locks held by other threads
+    entries = load_dicom_files(dicom_directory, previous, parallel=False)
+    removed = [path for path, entry in previous.items() if entries.get(path) is not entry and entry["record"] is not None]
+    added = {
+        path: entry["record"] for path, entry in entries.items()
+        if previous.get(path) is not entry and entry["record"] is not None
+    }
+    if removed or added:
+        hierarchy = query_hierarchy
+        catalog = dict(hierarchy.catalog)
+        for path in removed:
+            del catalog[path]
+        catalog.update(added)
+        index = hierarchy.index.updated(catalog, removed, added)
+        query_hierarchy = hierarchy.updated(catalog, index, removed, added)
+        metrics.inc('dicomhawk_archive_reloads_total')
+        changed = added.keys() & set(removed)
+        detailed_logger.info(
+            f"Reloaded DICOM archive in {time.monotonic() - started:.2f}s: {len(added) - len(changed)} added, "
+            f"{len(changed)} changed, {len(removed) - len(changed)} removed, {len(catalog)} instances"
+        )
+    archive_entries = entries
+
+def archive_watch_loop():
+    while True:
+        time.sleep(ARCHIVE_WATCH_INTERVAL)
+        try:
+            reload_archive()
+        except Exception as e:
+            exception_logger.error(f"Failed to reload DICOM archive {dicom_directory}: {e}")
+
+def start_archive_watcher():
+    if ARCHIVE_WATCH_INTERVAL > 0:
+        threading.Thread(target=archive_watch_loop, name='archive-watcher', daemon=True).start()
+
+# Session IDs of live associations, keyed by association. Entries are removed
+# on release, abort or connection close. At most SESSION_LIMIT are kept: when
+# full, entries of finished associations are purged first, then the oldest
+SESSION_LIMIT = int(os.environ.get('SESSION_LIMIT', '10000'))
+
+class SessionRegistry:
+    def __init__(self, limit):
+        self.limit = limit
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    # Register an association and return its new session ID
+    def open(self, assoc):
+        session_id = next_event_id()
+        with self.lock:
+            self.sessions[assoc] = session_id
+            if len(self.sessions) > self.limit:
+                for stale in [a for a in self.sessions if not a.is_alive()]:
+                    del self.sessions[stale]
+            while len(self.sessions) > self.limit:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+        return session_id
+
+    # Session ID of an association, or a fresh ID if it isn't tracked
+    def get(self, assoc):
+        with self.lock:
+            session_id = self.sessions.get(assoc)
+        return session_id or next_event_id()
+
+    # Remove an association, returning its session ID or None if not tracked
+    def pop(self, assoc):
+        with self.lock:
+            return self.sessions.pop(assoc, None)
+
+    def __len__(self):
+        return len(self.sessions)
 
-# Dictionary to store association session IDs
-assoc_sessions = {}
+assoc_sessions = SessionRegistry(SESSION_LIMIT)
+
+def handle_conn_open(event):
+    if DETAILED_LOG_MODE != 'full':
+        return
+    event.assoc.dump_pdus = should_dump_association(event.address[0])
+    if event.assoc.dump_pdus:
+        for dump_event, dump_handler in PDU_DUMP_HANDLERS:
+            event.assoc.bind(dump_event, dump_handler)
 
 def handle_assoc(event):
-    assoc_id = str(int(time.time() * 1000000))
-    assoc_sessions[event.assoc] = assoc_id
+    # EVT_ACSE_RECV also fires for release and abort requests
+    if not isinstance(event.primitive, A_ASSOCIATE):
+        return
+    assoc_id = assoc_sessions.open(event.assoc)
     detailed_logger.info(f"Association requested from {event.assoc.requestor.address}:{event.assoc.requestor.port}")
     
     version = event.assoc.requestor.implementation_version_name if event.assoc.requestor.implementation_version_name else "N/A"
@@ -163,7 +1340,7 @@ def handle_assoc(event):
     })
 
 def handle_release(event):
-    assoc_id = assoc_sessions.pop(event.assoc, str(int(time.time() * 1000000)))
+    assoc_id = assoc_sessions.pop(event.assoc) or next_event_id()
     detailed_logger.info(f"Association released from {event.assoc.requestor.address}:{event.assoc.requestor.port}")
     log_simplified_message({
         "session_id": assoc_id,
@@ -177,9 +1354,45 @@ def handle_release(event):
         "timestamp": datetime.now().isoformat()
     })
 
+def handle_abort(event):
+    assoc_id = assoc_sessions.pop(event.assoc)
+    if assoc_id is None:
+        return
+    detailed_logger.info(f"Association aborted from {event.assoc.requestor.address}:{event.assoc.requestor.port}")
+    log_simplified_message({
+        "session_id": assoc_id,
+        "ID": assoc_id,
+        "event": "Association aborted",
+        "IP": event.assoc.requestor.address,
+        "Port": event.assoc.requestor.port,
+        "Status": "Aborted",
+        "level": "warning",
+        "msg": "Connection",
+        "timestamp": datetime.now().isoformat()
+    })
+
+def handle_reject(event):
+    assoc_id = assoc_sessions.pop(event.assoc) or next_event_id()
+    detailed_logger.info(f"Association rejected from {event.assoc.requestor.address}:{event.assoc.requestor.port}")
+    log_simplified_message({
+        "session_id": assoc_id,
+        "ID": assoc_id,
+        "event": "Association rejected",
+        "IP": event.assoc.requestor.address,
+        "Port": event.assoc.requestor.port,
+        "Status": "Rejected",
+        "level": "warning",
+        "msg": "Connection",
+        "timestamp": datetime.now().isoformat()
+    })
+
+# Catch-all for connections closed any other way, e.g. timed out
+def handle_conn_close(event):
+    assoc_sessions.pop(event.assoc)
+
 def handle_find(event):
-    assoc_id = assoc_sessions.get(event.assoc, str(int(time.time() * 1000000)))
-    find_id = str(int(time.time() * 1000000))
+    assoc_id = assoc_sessions.get(event.assoc)
+    find_id = next_event_id()
     detailed_logger.info(f"C-FIND request received: {event.identifier}")
 
     # Convert PatientName to string for JSON serialization
@@ -209,11 +1422,21 @@ def handle_find(event):
         "timestamp": datetime.now().isoformat()
     })
 
+    level = str(event.identifier.get('QueryRetrieveLevel', '')).upper()
+    study_root = event.request.AffectedSOPClassUID == StudyRootQueryRetrieveInformationModelFind
+    if level not in QUERY_LEVELS or (study_root and level == 'PATIENT'):
+        # Identifier does not match SOP class
+        yield 0xA900, None
+        return
+
+    hierarchy = query_hierarchy
     matches = 0
-    for path, ds in dicom_datasets.items():
-        if term is None or ds.PatientName == term or term == '*':
-            matches += 1
-            yield 0xFF00, ds
+    for _, record in hierarchy.match(level, event.identifier):
+        if event.is_cancelled:
+            yield 0xFE00, None
+            return
+        matches += 1
+        yield 0xFF00, hierarchy.response(level, record, event.identifier)
 
     log_simplified_message({
         "session_id": assoc_id,
@@ -226,16 +1449,140 @@ def handle_find(event):
 
 
 
+# Received C-STORE instances are written as received, without decoding, to a
+# content-addressed spool: spool/<sha256[:2]>/<sha256>.dcm. When the spool
+# grows past SPOOL_MAX_BYTES the oldest files are removed; 0 disables spooling
+spool_directory = os.path.join(data_directory, 'spool')
+SPOOL_MAX_BYTES = int(os.environ.get('SPOOL_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+# Header attributes of received instances written to the logs
+STORE_LOG_KEYWORDS = os.environ.get('STORE_LOG_KEYWORDS', ','.join([
+    'SOPClassUID', 'SOPInstanceUID', 'StudyInstanceUID', 'SeriesInstanceUID',
+    'Modality', 'PatientName', 'PatientID', 'StudyDate', 'InstitutionName',
+    'Manufacturer', 'ManufacturerModelName',
+])).split(',')
+STORE_LOG_TAGS = [tag_for_keyword('SpecificCharacterSet')] + [tag_for_keyword(keyword.strip()) for keyword in STORE_LOG_KEYWORDS if tag_for_keyword(keyword.strip())]
+
+class Spool:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Spooled files and their sizes, least recently received first
+        self.files = OrderedDict()
+        self.size = 0
+
+    # Create the spool directory and pick up the files already in it
+    def open(self):
+        if self.max_bytes:
+            os.makedirs(self.directory, exist_ok=True)
+            self.scan()
+
+    def scan(self):
+        found = []
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                if not filename.endswith('.dcm'):
+                    # Left over from an interrupted write
+                    os.remove(path)
+                    continue
+                st = os.stat(path)
+                found.append((st.st_mtime_ns, path, st.st_size))
+        for _, path, size in sorted(found):
+            self.files[path] = size
+            self.size += size
+
+    # Write a received instance as a DICOM file, returning its SHA-256, size
+    # and whether it was spooled
+    def store(self, event):
+        dataset = event.request.DataSet.getbuffer()
+        meta = BytesIO()
+        meta.write(b'\x00' * 128 + b'DICM')
+        write_file_meta_info(meta, event.file_meta)
+        header = meta.getbuffer()
+        size = len(header) + len(dataset)
+        sha256 = hashlib.sha256(header)
+        sha256.update(dataset)
+        sha256 = sha256.hexdigest()
+        if size > self.max_bytes:
+            return sha256, size, False
+
+        path = os.path.join(self.directory, sha256[:2], f"{sha256}.dcm")
+        with self.lock:
+            if path in self.files:
+                # Same content received again, count it as fresh
+                self.files.move_to_end(path)
+                os.utime(path)
+                return sha256, size, True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            f.write(dataset)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            if path not in self.files:
+                self.files[path] = size
+                self.size += size
+            evicted = []
+            while self.size > self.max_bytes:
+                evicted_path, evicted_size = self.files.popitem(last=False)
+                self.size -= evicted_size
+                evicted.append(evicted_path)
+        for evicted_path in evicted:
+            try:
+                os.remove(evicted_path)
+            except OSError:
+                pass
+        return sha256, size, True
+
+    # Give worker process index of count its share of the quota; the files
+    # already spooled count against the first worker's share
+    def share(self, index, count):
+        with self.lock:
+            self.max_bytes //= count
+            if index:
+                self.files.clear()
+                self.size = 0
+
+store_spool = Spool(spool_directory, SPOOL_MAX_BYTES)
+
+# Read only the whitelisted header attributes from the received encoded dataset
+def read_store_header(event):
+    transfer_syntax = event.context.transfer_syntax
+    fp = event.request.DataSet
+    fp.seek(0)
+    if transfer_syntax.is_deflated:
+        fp = BytesIO(zlib.decompress(fp.getvalue(), -zlib.MAX_WBITS))
+    ds = read_dataset(fp, transfer_syntax.is_implicit_VR, transfer_syntax.is_little_endian, specific_tags=STORE_LOG_TAGS)
+    return {elem.keyword: str(elem.value) for elem in ds if elem.keyword != 'SpecificCharacterSet'}
+
 def handle_store(event):
-    assoc_id = assoc_sessions.get(event.assoc, str(int(time.time() * 1000000)))
-    store_id = str(int(time.time() * 1000000))
-    detailed_logger.info(f"C-STORE request received: {event.dataset}")
+    assoc_id = assoc_sessions.get(event.assoc)
+    store_id = next_event_id()
+    try:
+        header = read_store_header(event)
+    except Exception as e:
+        detailed_logger.error(f"Failed to read C-STORE dataset header: {e}")
+        header = {}
+    sha256 = size = None
+    spooled = False
+    try:
+        sha256, size, spooled = store_spool.store(event)
+    except OSError as e:
+        detailed_logger.error(f"Failed to spool C-STORE dataset: {e}")
+    detailed_logger.info(f"C-STORE request received: {header}, {size} bytes, sha256 {sha256}")
     log_simplified_message({
         "session_id": assoc_id,
         "ID": store_id,
         "event": "C-STORE request received",
         "Command": "C-STORE",
-        "dataset": {tag: str(value) for tag, value in event.dataset.items()},
+        "dataset": header,
+        "sha256": sha256,
+        "size": size,
+        "spooled": spooled,
         "level": "info",
         "msg": "Received",
         "timestamp": datetime.now().isoformat()
@@ -243,8 +1590,8 @@ def handle_store(event):
     return 0x0000
 
 def handle_echo(event):
-    assoc_id = assoc_sessions.get(event.assoc, str(int(time.time() * 1000000)))
-    echo_id = str(int(time.time() * 1000000))
+    assoc_id = assoc_sessions.get(event.assoc)
+    echo_id = next_event_id()
     detailed_logger.info(f"C-ECHO request received")
     log_simplified_message({
         "session_id": assoc_id,
@@ -257,9 +1604,208 @@ def handle_echo(event):
     })
     return 0x0000
 
+# C-MOVE destinations, MOVE_DESTINATIONS is a comma separated list of
+# AETITLE=host:port entries. MOVE_SINK_AET is served by a local stand-in
+# Storage SCP on MOVE_SINK_PORT (0 disables it) that accepts and discards
+# everything, so C-MOVE can be exercised without a real destination.
+MOVE_SINK_AET = os.environ.get('MOVE_SINK_AET', 'DICOMHAWK_SINK')
+MOVE_SINK_PORT = int(os.environ.get('MOVE_SINK_PORT', '11113'))
+# C-STORE sub-operations in flight per C-MOVE, threads shared by all C-MOVEs,
+# and idle outbound associations kept per destination for reuse
+MOVE_MAX_PARALLEL = int(os.environ.get('MOVE_MAX_PARALLEL', '4'))
+MOVE_WORKERS = int(os.environ.get('MOVE_WORKERS', '16'))
+MOVE_POOL_SIZE = int(os.environ.get('MOVE_POOL_SIZE', '4'))
+MOVE_POOL_IDLE_TIMEOUT = float(os.environ.get('MOVE_POOL_IDLE_TIMEOUT', '30'))
+
+def parse_move_destinations(value):
+    destinations = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(','))):
+        ae_title, address = entry.split('=', 1)
+        host, port = address.rsplit(':', 1)
+        destinations[ae_title.strip()] = (host.strip(), int(port))
+    return destinations
+
+move_destinations = parse_move_destinations(os.environ.get('MOVE_DESTINATIONS', ''))
+if MOVE_SINK_PORT:
+    move_destinations.setdefault(MOVE_SINK_AET, ('127.0.0.1', MOVE_SINK_PORT))
+
+# Outbound associations keyed by (host, port, AE title, presentation contexts),
+# the contexts being the storage_contexts of the archive snapshot they send
+# from. Each association is used by one sub-operation at a time, then returned
+# to the idle list
+class OutboundAssociationPool:
+    def __init__(self, size, idle_timeout):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    # Return an idle association or a new one, which may not be established
+    def open(self, key):
+        self.expire()
+        with self.lock:
+            idle = self.idle.get(key, [])
+            while idle:
+                assoc, _ = idle.pop()
+                if assoc.is_established:
+                    return assoc
+        host, port, ae_title, contexts = key
+        assoc = ae.associate(host, port, ae_title=ae_title, contexts=[
+            build_context(sop_class, list(syntaxes)) for sop_class, syntaxes in contexts
+        ])
+        assoc.next_message_id = 1
+        return assoc
+
+    def acquire(self, key):
+        assoc = self.open(key)
+        if not assoc.is_established:
+            host, port, ae_title, _ = key
+            raise ConnectionError(f"Unable to associate with {ae_title} at {host}:{port}")
+        return assoc
+
+    def release(self, key, assoc):
+        if not assoc.is_established:
+            return
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.size:
+                idle.append((assoc, time.monotonic()))
+                return
+        assoc.release()
+
+    # Release associations that have been idle for longer than idle_timeout
+    def expire(self, idle_timeout=None):
+        deadline = time.monotonic() - (self.idle_timeout if idle_timeout is None else idle_timeout)
+        expired = []
+        with self.lock:
+            for key, idle in self.idle.items():
+                expired.extend(assoc for assoc, released_at in idle if released_at <= deadline)
+                idle[:] = [(assoc, released_at) for assoc, released_at in idle if released_at > deadline]
+        for assoc in expired:
+            if assoc.is_established:
+                assoc.release()
+
+    def close(self):
+        self.expire(idle_timeout=-1)
+
+move_pool = OutboundAssociationPool(MOVE_POOL_SIZE, MOVE_POOL_IDLE_TIMEOUT)
+move_executor = ThreadPoolExecutor(max_workers=MOVE_WORKERS, thread_name_prefix='c-move')
+atexit.register(move_pool.close)
+
+def move_pool_reaper_loop():
+    while True:
+        time.sleep(MOVE_POOL_IDLE_TIMEOUT)
+        move_pool.expire()
+
+# Send one archived instance over a pooled association, returning the status
+def send_archived_instance(key, path, record, originator_aet, originator_id):
+    assoc = move_pool.acquire(key)
+    try:
+        message_id = assoc.next_message_id
+        assoc.next_message_id = message_id % 65535 + 1
+        return assoc.send_c_store(
+            ArchivedInstance(path, record),
+            msg_id=message_id,
+            originator_aet=originator_aet,
+            originator_id=originator_id
+        )
+    finally:
+        move_pool.release(key, assoc)
+
+# Stands in for the store association pynetdicom opens for a C-MOVE. Up to
+# MOVE_MAX_PARALLEL sub-operations run ahead on pooled associations, and each
+# send_c_store call from pynetdicom returns the next result in order, so the
+# pending responses carry the usual sub-operation counts. Once the destination
+# cannot be reached, the remaining sub-operations fail without being sent.
+class MoveTransfer:
+    def __init__(self, destination, ae_title, paths, hierarchy, originator_aet, originator_id):
+        self.key = (destination[0], destination[1], ae_title, hierarchy.storage_contexts)
+        self.paths = deque(paths)
+        self.catalog = hierarchy.catalog
+        self.originator_aet = originator_aet
+        self.originator_id = originator_id
+        self.futures = deque()
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.unreachable = False
+        self.is_established = False
+
+    # Open the first association before any sub-operation. Returns the failed
+    # association if the destination cannot be reached, so pynetdicom answers
+    # the C-MOVE with 0xA801 instead of waiting for every sub-operation
+    def start(self):
+        assoc = move_pool.open(self.key)
+        if not assoc.is_established:
+            host, port, ae_title, _ = self.key
+            detailed_logger.error(f"Unable to associate with C-MOVE destination {ae_title} at {host}:{port}")
+            return assoc
+        move_pool.release(self.key, assoc)
+        self.is_established = True
+        with self.lock:
+            self.submit()
+        return self
+
+    def submit(self):
+        while self.paths and not self.unreachable and len(self.futures) < MOVE_MAX_PARALLEL:
+            path = self.paths.popleft()
+            self.futures.append(move_executor.submit(
+                send_archived_instance, self.key, path, self.catalog[path], self.originator_aet, self.originator_id
+            ))
+
+    def send_c_store(self, dataset, msg_id=1, priority=2, originator_aet=None, originator_id=None):
+        with self.lock:
+            future = self.futures.popleft() if self.futures else None
+            self.submit()
+        if future is None:
+            self.failed += 1
+            raise ConnectionError(f"Not sent, {self.key[2]} is unreachable")
+        try:
+            status = future.result()
+        except ConnectionError as e:
+            # Stop submitting, the remaining sub-operations fail at once
+            self.failed += 1
+            with self.lock:
+                if not self.unreachable:
+                    detailed_logger.error(f"C-MOVE sub-operation to {self.key[2]} failed: {e}")
+                self.unreachable = True
+                for queued in self.futures:
+                    queued.cancel()
+            raise
+        except CancelledError:
+            self.failed += 1
+            raise
+        except Exception as e:
+            self.failed += 1
+            detailed_logger.error(f"C-MOVE sub-operation to {self.key[2]} failed: {e}")
+            raise
+        if status.get('Status', 0xA700) in (0x0000, 0xB000, 0xB006, 0xB007):
+            self.completed += 1
+        else:
+            self.failed += 1
+        return status
+
+    def release(self):
+        self.is_established = False
+        with self.lock:
+            self.paths.clear()
+            for future in self.futures:
+                future.cancel()
+            self.futures.clear()
+        host, port, ae_title, _ = self.key
+        detailed_logger.info(f"C-MOVE to {ae_title} at {host}:{port} finished: {self.completed} sent, {self.failed} failed")
+
+# The AE returns the handler's MoveTransfer when pynetdicom asks it to open the
+# C-MOVE store association, see handle_move
+class HoneypotAE(AE):
+    def associate(self, addr, port, *args, move_transfer=None, **kwargs):
+        if move_transfer is not None:
+            return move_transfer.start()
+        return super().associate(addr, port, *args, **kwargs)
+
 def handle_move(event):
-    assoc_id = assoc_sessions.get(event.assoc, str(int(time.time() * 1000000)))
-    move_id = str(int(time.time() * 1000000))
+    assoc_id = assoc_sessions.get(event.assoc)
+    move_id = next_event_id()
     detailed_logger.info(f"C-MOVE request received: {event.identifier}")
     log_simplified_message({
         "session_id": assoc_id,
@@ -271,18 +1817,30 @@ def handle_move(event):
         "msg": "Received",
         "timestamp": datetime.now().isoformat()
     })
-    ds = Dataset()
-    ds.SOPInstanceUID = generate_uid()
-    ds.PatientName = "Doe^John"
-    ds.PatientID = "12345"
-    ds.StudyInstanceUID = generate_uid()
-    ds.SeriesInstanceUID = generate_uid()
-    ds.SOPClassUID = CTImageStorage
-    yield 1, ds
+    destination = move_destinations.get(event.move_destination)
+    if destination is None:
+        detailed_logger.warning(f"Unknown C-MOVE destination: {event.move_destination}")
+        yield None, None
+        return
+
+    hierarchy = query_hierarchy
+    paths = hierarchy.match_instances(event.identifier)
+    transfer = MoveTransfer(destination, event.move_destination, paths, hierarchy, event.assoc.requestor.ae_title, event.request.MessageID)
+    yield destination[0], destination[1], {'move_transfer': transfer}
+
+    # Yield the number of remaining sub-operations, then one pending status
+    # per instance as its C-STORE sub-operation completes
+    yield len(paths)
+
+    for path in paths:
+        if event.is_cancelled:
+            yield 0xFE00, None
+            return
+        yield 0xFF00, ArchivedInstance(path, hierarchy.catalog[path])
 
 def handle_get(event):
-    assoc_id = assoc_sessions.get(event.assoc, str(int(time.time() * 1000000)))
-    get_id = str(int(time.time() * 1000000))
+    assoc_id = assoc_sessions.get(event.assoc)
+    get_id = next_event_id()
     detailed_logger.info(f"C-GET request received: {event.identifier}")
     log_simplified_message({
         "session_id": assoc_id,
@@ -294,49 +1852,450 @@ def handle_get(event):
         "msg": "Received",
         "timestamp": datetime.now().isoformat()
     })
-    remaining_subops = len(dicom_datasets)
-    
+    # Instances are encoded one at a time as each C-STORE sub-operation is sent
+    hierarchy = query_hierarchy
+    paths = hierarchy.match_instances(event.identifier)
+
     # Yield the number of remaining sub-operations as the first item
-    yield remaining_subops
-    
-    for path, ds in dicom_datasets.items():
-        yield remaining_subops, ds
-        remaining_subops -= 1
-    yield 0
+    yield len(paths)
+
+    for path in paths:
+        if event.is_cancelled:
+            yield 0xFE00, None
+            return
+        yield 0xFF00, ArchivedInstance(path, hierarchy.catalog[path])
+
+
+# Prometheus metrics, served as text on METRICS_PORT (0 disables). With
+# DICOM_WORKERS > 1 the supervisor serves the log queue depth and records
+# written on METRICS_PORT and worker N serves its own metrics, including the
+# records it dropped, on METRICS_PORT + 1 + N
+METRICS_HOST = os.environ.get('METRICS_HOST', os.environ.get('DICOM_HOST', '172.29.0.3'))
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '9112'))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRIC_HELP = {
+    'dicomhawk_handler_calls_total': ('counter', 'Calls of each event handler'),
+    'dicomhawk_handler_errors_total': ('counter', 'Event handler calls that raised an exception'),
+    'dicomhawk_handler_responses_total': ('counter', 'Responses yielded by C-FIND, C-GET and C-MOVE handlers'),
+    'dicomhawk_handler_duration_seconds': ('histogram', 'Event handler run time, until the last response for C-FIND, C-GET and C-MOVE'),
+    'dicomhawk_association_setup_seconds': ('histogram', 'Time from connection to association acceptance'),
+    'dicomhawk_associations_total': ('counter', 'Associations by outcome'),
+    'dicomhawk_bytes_sent_total': ('counter', 'Bytes sent to peers on inbound associations'),
+    'dicomhawk_bytes_received_total': ('counter', 'Bytes received from peers on inbound associations'),
+    'dicomhawk_associations_open': ('gauge', 'Associations currently tracked for session IDs'),
+    'dicomhawk_log_queue_depth': ('gauge', 'Log records waiting to be written'),
+    'dicomhawk_log_records_written_total': ('counter', 'Log records written by the log listener'),
+    'dicomhawk_log_records_dropped_total': ('counter', 'Log records dropped because the log queue was full'),
+    'dicomhawk_archive_instances': ('gauge', 'Instances in the decoy archive'),
+    'dicomhawk_archive_reloads_total': ('counter', 'Archive rescans that found added, changed or removed files'),
+    'dicomhawk_startup_seconds': ('gauge', 'Time from process start until the DICOM ports were listening'),
+}
+
+# Counters and histograms keyed by metric name and label pairs. Updates take
+# one lock, held for a dict update, so instrumenting every handler is cheap
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+            histogram[0][bucket] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def render(self, gauges):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(buckets), total, count) for key, (buckets, total, count) in self.histograms.items()}
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms.items():
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for name, value in gauges.items():
+            samples[name] = [f"{name} {value}"]
+        output = []
+        for name in sorted(samples):
+            metric_type, description = METRIC_HELP[name]
+            output.append(f"# HELP {name} {description}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(samples[name])
+        return '\n'.join(output) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
 
+metrics = Metrics()
+
+# Gauges read when metrics are scraped
+def current_gauges():
+    gauges = {
+        'dicomhawk_associations_open': len(assoc_sessions),
+        'dicomhawk_archive_instances': len(query_hierarchy.catalog),
+    }
+    if startup_seconds is not None:
+        gauges['dicomhawk_startup_seconds'] = round(startup_seconds, 3)
+    # Each process counts only its own records, so the log server's sum over
+    # all endpoints is the total. The queue is shared with the workers, so its
+    # depth is reported once, by the process running the listener
+    with log_stats_lock:
+        gauges['dicomhawk_log_records_written_total'] = log_queue_stats["written"]
+        gauges['dicomhawk_log_records_dropped_total'] = sum(log_queue_stats["dropped"].values())
+    if log_listener_thread is not None and log_listener_thread.is_alive():
+        gauges['dicomhawk_log_queue_depth'] = log_queue.qsize()
+    return gauges
+
+# Wrap a handler to count its calls, errors and yielded responses and time it.
+# Generator handlers are timed until they are exhausted, as pynetdicom sends
+# each response before asking for the next
+def instrument_handler(event_type, handler):
+    labels = (('event', event_type.name), ('handler', handler.__name__))
+
+    if inspect.isgeneratorfunction(handler):
+        @functools.wraps(handler)
+        def instrumented(event, *args):
+            start = time.perf_counter()
+            responses = 0
+            try:
+                for response in handler(event, *args):
+                    responses += 1
+                    yield response
+            except Exception:
+                metrics.inc('dicomhawk_handler_errors_total', labels)
+                raise
+            finally:
+                metrics.inc('dicomhawk_handler_calls_total', labels)
+                metrics.inc('dicomhawk_handler_responses_total', labels, responses)
+                metrics.observe('dicomhawk_handler_duration_seconds', labels, time.perf_counter() - start)
+        return instrumented
+
+    @functools.wraps(handler)
+    def instrumented(event, *args):
+        start = time.perf_counter()
+        try:
+            return handler(event, *args)
+        except Exception:
+            metrics.inc('dicomhawk_handler_errors_total', labels)
+            raise
+        finally:
+            metrics.inc('dicomhawk_handler_calls_total', labels)
+            metrics.observe('dicomhawk_handler_duration_seconds', labels, time.perf_counter() - start)
+    return instrumented
+
+def handle_metrics_conn_open(event):
+    event.assoc.opened_at = time.perf_counter()
+
+def handle_metrics_accepted(event):
+    metrics.inc('dicomhawk_associations_total', (('outcome', 'accepted'),))
+    opened_at = getattr(event.assoc, 'opened_at', None)
+    if opened_at is not None:
+        metrics.observe('dicomhawk_association_setup_seconds', (), time.perf_counter() - opened_at)
+
+def handle_metrics_outcome(event):
+    outcome = {evt.EVT_REJECTED: 'rejected', evt.EVT_RELEASED: 'released', evt.EVT_ABORTED: 'aborted'}[event.event]
+    metrics.inc('dicomhawk_associations_total', (('outcome', outcome),))
+
+def handle_metrics_data_sent(event):
+    metrics.inc('dicomhawk_bytes_sent_total', (), len(event.data))
+
+def handle_metrics_data_recv(event):
+    metrics.inc('dicomhawk_bytes_received_total', (), len(event.data))
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render(current_gauges()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes are not worth a log line each
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port):
+    if not METRICS_PORT:
+        return
+    try:
+        server = ThreadingHTTPServer((METRICS_HOST, port), MetricsRequestHandler)
+    except OSError as e:
+        exception_logger.error(f"Failed to start metrics server on {METRICS_HOST}:{port}: {e}")
+        return
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    detailed_logger.info(f"Serving metrics on http://{METRICS_HOST}:{port}/metrics")
 
 handlers = [
+    (evt.EVT_CONN_OPEN, handle_conn_open),
     (evt.EVT_ACSE_RECV, handle_assoc),
     (evt.EVT_RELEASED, handle_release),
+    (evt.EVT_ABORTED, handle_abort),
+    (evt.EVT_REJECTED, handle_reject),
+    (evt.EVT_CONN_CLOSE, handle_conn_close),
     (evt.EVT_C_FIND, handle_find),
     (evt.EVT_C_STORE, handle_store),
     (evt.EVT_C_ECHO, handle_echo),
     (evt.EVT_C_MOVE, handle_move),
     (evt.EVT_C_GET, handle_get),
 ]
+handlers = [(event_type, instrument_handler(event_type, handler)) for event_type, handler in handlers]
+handlers += [
+    (evt.EVT_CONN_OPEN, handle_metrics_conn_open),
+    (evt.EVT_ACCEPTED, handle_metrics_accepted),
+    (evt.EVT_REJECTED, handle_metrics_outcome),
+    (evt.EVT_RELEASED, handle_metrics_outcome),
+    (evt.EVT_ABORTED, handle_metrics_outcome),
+    (evt.EVT_DATA_SENT, handle_metrics_data_sent),
+    (evt.EVT_DATA_RECV, handle_metrics_data_recv),
+]
 
-ae = AE()
+ae = HoneypotAE()
 ae.add_supported_context(PatientRootQueryRetrieveInformationModelFind)
 ae.add_supported_context(PatientRootQueryRetrieveInformationModelGet)
+ae.add_supported_context(PatientRootQueryRetrieveInformationModelMove)
 ae.add_supported_context(CTImageStorage)
 ae.add_supported_context(MRImageStorage)
 ae.add_supported_context(Verification)
 
-for context in StoragePresentationContexts + VerificationPresentationContexts + QueryRetrievePresentationContexts:
+for context in VerificationPresentationContexts + QueryRetrievePresentationContexts:
     ae.add_supported_context(context.abstract_syntax)
 
+# Storage contexts accept SCP/SCU role selection so C-GET peers can take the
+# Storage SCP role for the C-STORE sub-operations
+for context in StoragePresentationContexts:
+    ae.add_supported_context(context.abstract_syntax, scu_role=True, scp_role=True)
+
+# Listener limits. Up to MAX_ASSOCIATIONS associations are served at once and
+# further ones are rejected by pynetdicom with A-ASSOCIATE-RJ. Connections are
+# refused at accept, before any thread is started, when the source address is
+# over its RATE_LIMIT_PER_IP token bucket (RATE_LIMIT_BURST tokens, refilled
+# at RATE_LIMIT_PER_IP per second), already has MAX_CONNECTIONS_PER_IP open,
+# or when MAX_CONNECTIONS are open in total.
+MAX_ASSOCIATIONS = int(os.environ.get('MAX_ASSOCIATIONS', '50'))
+MAX_CONNECTIONS = int(os.environ.get('MAX_CONNECTIONS', str(2 * MAX_ASSOCIATIONS)))
+MAX_CONNECTIONS_PER_IP = int(os.environ.get('MAX_CONNECTIONS_PER_IP', '10'))
+RATE_LIMIT_PER_IP = float(os.environ.get('RATE_LIMIT_PER_IP', '5'))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '20'))
+RATE_LIMIT_TRACKED_IPS = 10000
+REFUSED_LOG_INTERVAL = 10
+
+# Timeouts in seconds: ACSE for association negotiation, DIMSE for replies
+# to messages, NETWORK for idle associations and CONNECTION for outbound TCP
+# connections (C-MOVE destinations)
+ae.acse_timeout = float(os.environ.get('ACSE_TIMEOUT', '30'))
+ae.dimse_timeout = float(os.environ.get('DIMSE_TIMEOUT', '30'))
+ae.network_timeout = float(os.environ.get('NETWORK_TIMEOUT', '60'))
+ae.connection_timeout = float(os.environ.get('CONNECTION_TIMEOUT', '10'))
+ae.maximum_associations = MAX_ASSOCIATIONS
+
+class TokenBuckets:
+    def __init__(self, rate, burst, max_tracked):
+        self.rate = rate
+        self.burst = burst
+        self.max_tracked = max_tracked
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self.buckets) > self.max_tracked:
+                self.prune(now)
+            return allowed
+
+    # Forget sources whose bucket has refilled, they'd start full anyway
+    def prune(self, now):
+        full = [key for key, (tokens, updated) in self.buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for key in full:
+            del self.buckets[key]
+
+connection_buckets = TokenBuckets(RATE_LIMIT_PER_IP, RATE_LIMIT_BURST, RATE_LIMIT_TRACKED_IPS)
+
+# Refused connections are logged once per REFUSED_LOG_INTERVAL per source and
+# reason, with the number refused since the last entry
+refused_lock = threading.Lock()
+refused_connections = {}
+
+def log_refused_connection(address, reason):
+    now = time.monotonic()
+    with refused_lock:
+        count, logged_at = refused_connections.get((address[0], reason), (0, None))
+        count += 1
+        if logged_at is not None and now - logged_at < REFUSED_LOG_INTERVAL:
+            refused_connections[(address[0], reason)] = (count, logged_at)
+            return
+        refused_connections[(address[0], reason)] = (0, now)
+        if len(refused_connections) > RATE_LIMIT_TRACKED_IPS:
+            refused_connections.clear()
+    detailed_logger.warning(f"Connection refused from {address[0]}:{address[1]} ({reason}), {count} refused")
+    log_simplified_message({
+        "ID": next_event_id(),
+        "event": "Connection refused",
+        "IP": address[0],
+        "Port": address[1],
+        "Reason": reason,
+        "Refused": count,
+        "level": "warning",
+        "msg": "Connection refused",
+        "timestamp": datetime.now().isoformat()
+    })
+
+class LimitedAssociationServer(AssociationServer):
+    request_queue_size = 128
+
+    # Worker processes listen on the same ports, the kernel spreads connections
+    def server_bind(self):
+        if DICOM_WORKERS > 1:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def verify_request(self, request, client_address):
+        if not connection_buckets.allow(client_address[0]):
+            log_refused_connection(client_address, "rate limit")
+            return False
+        active = self.active_associations
+        if len(active) >= MAX_CONNECTIONS:
+            log_refused_connection(client_address, "connection limit")
+            return False
+        if sum(assoc.requestor.address == client_address[0] for assoc in active) >= MAX_CONNECTIONS_PER_IP:
+            log_refused_connection(client_address, "per-address connection limit")
+            return False
+        return True
+
 def is_port_in_use(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('0.0.0.0', port)) == 0
 
-def start_dicom_server():
-    dicom_port = 11112
-    if is_port_in_use(dicom_port):
-        print(f"Port {dicom_port} is in use. Please free up the port and try again.")
-        return
-    ae.start_server(('172.29.0.3', dicom_port), evt_handlers=handlers)
+# Local stand-in C-MOVE destination that accepts and discards every instance
+def handle_sink_store(event):
+    return 0x0000
+
+def start_move_sink():
+    sink_ae = AE(ae_title=MOVE_SINK_AET)
+    for context in StoragePresentationContexts:
+        sink_ae.add_supported_context(context.abstract_syntax)
+    sink_ae.start_server(('127.0.0.1', MOVE_SINK_PORT), block=False, evt_handlers=[(evt.EVT_C_STORE, handle_sink_store)])
+
+# Listening address and ports (comma separated, e.g. 104,11112,4242). With
+# DICOM_WORKERS > 1 a supervisor process forks that many workers, which share
+# the catalog loaded here and each listen on every port
+DICOM_HOST = os.environ.get('DICOM_HOST', '172.29.0.3')
+DICOM_PORTS = [int(port) for port in os.environ.get('DICOM_PORTS', '11112').split(',')]
+
+# Seconds from process start until the ports were listening
+startup_seconds = None
 
+def serve_dicom_ports():
+    global startup_seconds
+    threading.Thread(target=move_pool_reaper_loop, name='c-move-pool-reaper', daemon=True).start()
+    start_archive_watcher()
+    servers = [ae.make_server((DICOM_HOST, port), evt_handlers=handlers, server_class=LimitedAssociationServer) for port in DICOM_PORTS]
+    startup_seconds = time.monotonic() - startup_started
+    detailed_logger.info(f"Listening on {DICOM_HOST} ports {DICOM_PORTS} {startup_seconds:.2f}s after start")
+    for server in servers[1:]:
+        threading.Thread(target=server.serve_forever, name=f"dicom-listener-{server.server_address[1]}", daemon=True).start()
+    try:
+        servers[0].serve_forever()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+def run_dicom_worker(index):
+    global event_id_offset, log_queue_stats, log_stats_lock
+    event_id_offset = index
+    # Start from zero rather than the supervisor's counts at fork time
+    log_queue_stats = {"written": 0, "dropped": {}}
+    log_stats_lock = threading.Lock()
+    store_spool.share(index, DICOM_WORKERS)
+    start_metrics_server(METRICS_PORT + 1 + index)
+    serve_dicom_ports()
+
+# Keep DICOM_WORKERS worker processes running, restarting any that exit
+def supervise_dicom_workers():
+    context = multiprocessing.get_context('fork')
+    workers = [None] * DICOM_WORKERS
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
 
+    try:
+        while True:
+            for index, worker in enumerate(workers):
+                if worker is not None and worker.is_alive():
+                    continue
+                if worker is not None:
+                    exception_logger.error(f"DICOM worker {index} exited with code {worker.exitcode}, restarting")
+                workers[index] = context.Process(target=run_dicom_worker, args=(index,), name=f"dicom-worker-{index}", daemon=True)
+                workers[index].start()
+                detailed_logger.info(f"Started DICOM worker {index} (pid {workers[index].pid}) on ports {DICOM_PORTS}")
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            if worker is not None:
+                worker.terminate()
+        for worker in workers:
+            if worker is not None:
+                worker.join(timeout=5)
+
+def start_dicom_server():
+    for dicom_port in DICOM_PORTS:
+        if is_port_in_use(dicom_port):
+            print(f"Port {dicom_port} is in use. Please free up the port and try again.")
+            return
+    if MOVE_SINK_PORT:
+        start_move_sink()
+    start_metrics_server(METRICS_PORT)
+    if DICOM_WORKERS > 1:
+        supervise_dicom_workers()
+    else:
+        serve_dicom_ports()
 
+# Entry point. Importing this module has no effects outside it: log files,
+# threads, the archive and the listening sockets are all started from here
+def main():
+    setup_logging()
+    store_spool.open()
+    pynetdicom.association.encode = encode_with_cache
+    imported = time.monotonic() - startup_started
+    load_archive()
+    detailed_logger.info(
+        f"Started in {time.monotonic() - startup_started:.2f}s: imports and setup {imported:.2f}s, "
+        f"archive {time.monotonic() - startup_started - imported:.2f}s ({len(query_hierarchy.catalog)} instances)"
+    )
+    start_dicom_server()
 
-start_dicom_server()
+if __name__ == '__main__':
+    main()
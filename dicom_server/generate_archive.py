@@ -0,0 +1,352 @@
+"""Generate a large synthetic decoy archive for DICOMHawk.
+
+Writes a patient/study/series/instance hierarchy with shared UIDs, several
+modalities and plausible NumPy-generated pixel data, e.g.
+
+    python generate_archive.py dicom_files --patients 500 --workers 8
+
+Every series is written by one worker process from a header template that is
+encoded once, so each instance only encodes its few per-instance elements, and
+from body images rendered once per series with per-instance noise added.
+"""
+import argparse
+import os
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+from pydicom.dataset import Dataset
+from pydicom.filebase import DicomBytesIO
+from pydicom.filewriter import write_dataset
+from pydicom.tag import Tag
+from pydicom.uid import ExplicitVRLittleEndian, PYDICOM_IMPLEMENTATION_UID, generate_uid
+from pynetdicom.sop_class import (
+    CTImageStorage,
+    ComputedRadiographyImageStorage,
+    MRImageStorage,
+    UltrasoundImageStorage
+)
+
+FIRST_NAMES = ["Frederik", "Sofie", "Lukas", "Emma", "William", "Ida", "Noah", "Anna", "Oliver", "Laura",
+               "Magnus", "Freja", "Victor", "Clara", "Oscar", "Alma", "Carl", "Ella", "Emil", "Agnes"]
+LAST_NAMES = ["Jensen", "Nielsen", "Hansen", "Pedersen", "Andersen", "Christensen", "Larsen", "Sørensen",
+              "Rasmussen", "Jørgensen", "Petersen", "Madsen", "Kristensen", "Olsen", "Thomsen", "Poulsen"]
+INSTITUTIONS = ["Rigshospitalet", "Aarhus Universitetshospital", "Odense Universitetshospital",
+                "Aalborg Universitetshospital", "Herlev Hospital"]
+PHYSICIANS = ["Holm^Mette", "Berg^Anders", "Dahl^Karen", "Lund^Henrik", "Krogh^Pia"]
+
+# Per-modality image geometry, SOP class and the series layout to draw from
+MODALITIES = {
+    'CT': {
+        'sop_class': CTImageStorage, 'rows': 512, 'columns': 512, 'bits': 16,
+        'series': (1, 3), 'instances': (20, 80), 'spacing': 0.7, 'thickness': 2.5,
+        'studies': ["CT THORAX", "CT ABDOMEN", "CT CEREBRUM", "CT COLUMNA"],
+    },
+    'MR': {
+        'sop_class': MRImageStorage, 'rows': 256, 'columns': 256, 'bits': 16,
+        'series': (2, 5), 'instances': (15, 40), 'spacing': 0.9, 'thickness': 4.0,
+        'studies': ["MR CEREBRUM", "MR KNAE", "MR COLUMNA LUMBALIS"],
+    },
+    'CR': {
+        'sop_class': ComputedRadiographyImageStorage, 'rows': 1024, 'columns': 1024, 'bits': 16,
+        'series': (1, 2), 'instances': (1, 2), 'spacing': 0.15, 'thickness': None,
+        'studies': ["RTG THORAX", "RTG HAAND", "RTG BAEKKEN"],
+    },
+    'US': {
+        'sop_class': UltrasoundImageStorage, 'rows': 480, 'columns': 640, 'bits': 8,
+        'series': (1, 1), 'instances': (1, 10), 'spacing': None, 'thickness': None,
+        'studies': ["UL ABDOMEN", "UL HJERTE"],
+    },
+}
+
+# Elements that differ between the instances of a series, in tag order. The
+# rest of the header is encoded once per series around them.
+INSTANCE_KEYWORDS = ['SOPInstanceUID', 'InstanceNumber', 'ImagePositionPatient', 'SliceLocation']
+INSTANCE_TAGS = [Tag(keyword) for keyword in INSTANCE_KEYWORDS]
+
+PREAMBLE = b'\0' * 128 + b'DICM'
+
+
+def encode_dataset(ds):
+    fp = DicomBytesIO()
+    fp.is_little_endian = True
+    fp.is_implicit_VR = False
+    write_dataset(fp, ds)
+    return fp.getvalue()
+
+
+# Encode a short explicit VR little endian element (UI, IS, DS) without pydicom
+def encode_element(tag, vr, value):
+    value = value.encode('ascii')
+    if len(value) % 2:
+        value += b'\0' if vr == 'UI' else b' '
+    return struct.pack('<HH2sH', tag >> 16, tag & 0xFFFF, vr.encode('ascii'), len(value)) + value
+
+
+def format_ds(value):
+    return f"{value:.6g}"
+
+
+# File meta information around the per-instance MediaStorageSOPInstanceUID
+def file_meta_template(sop_class_uid):
+    head = struct.pack('<HH2sHI', 0x0002, 0x0001, b'OB', 0, 2) + b'\x00\x01'
+    head += encode_element(Tag(0x0002, 0x0002), 'UI', sop_class_uid)
+    tail = encode_element(Tag(0x0002, 0x0010), 'UI', ExplicitVRLittleEndian)
+    tail += encode_element(Tag(0x0002, 0x0012), 'UI', PYDICOM_IMPLEMENTATION_UID)
+    return head, tail
+
+
+def encode_file_meta(template, sop_instance_uid):
+    head, tail = template
+    body = head + encode_element(Tag(0x0002, 0x0003), 'UI', sop_instance_uid) + tail
+    return struct.pack('<HH2sHI', 0x0002, 0x0000, b'UL', 4, len(body)) + body
+
+
+# Split the shared header into encoded chunks that fall between the per-instance tags
+def build_header_template(shared):
+    bounds = [Tag(0, 0)] + INSTANCE_TAGS + [Tag(0x7FE0, 0x0010)]
+    chunks = []
+    for low, high in zip(bounds, bounds[1:]):
+        chunk = Dataset()
+        for elem in shared:
+            if low < elem.tag < high:
+                chunk.add(elem)
+        chunks.append(encode_dataset(chunk))
+    return chunks
+
+
+# Body images rendered once per series; each instance picks the one for its
+# position and adds a window of a shared noise field at a random offset
+class PixelGenerator:
+    # Number of distinct cross-sections rendered per series
+    LEVELS = 32
+
+    def __init__(self, rng, spec):
+        self.rng = rng
+        self.rows, self.columns = spec['rows'], spec['columns']
+        self.dtype = np.uint8 if spec['bits'] == 8 else np.uint16
+        yy, xx = np.meshgrid(np.linspace(-1, 1, self.rows, dtype=np.float32),
+                             np.linspace(-1, 1, self.columns, dtype=np.float32), indexing='ij')
+        noise = rng.standard_normal((self.rows * 2, self.columns * 2), dtype=np.float32)
+        if spec['bits'] == 8:
+            # Ultrasound-like speckle in a sector, one image is enough
+            sector = (np.abs(xx) < (yy + 1.0) * 0.6).astype(np.float32)
+            self.noise = (np.abs(noise) * 40.0).astype(np.int16)
+            self.bodies = [(sector * 60.0).astype(np.int16)]
+            self.sector = sector.astype(np.int16)
+            self.maximum = 255
+            return
+        # Elliptical body with a denser organ, shrinking towards the ends of the volume
+        a, b = rng.uniform(0.6, 0.9), rng.uniform(0.45, 0.7)
+        tissue, organ = rng.uniform(900, 1100), rng.uniform(50, 250)
+        radius = (xx / a) ** 2 + (yy / b) ** 2
+        self.noise = (noise * 20.0).astype(np.int16)
+        self.bodies = []
+        for level in range(self.LEVELS):
+            position = 2.0 * level / (self.LEVELS - 1) - 1.0
+            scale = max(0.05, 1.0 - position ** 2)
+            body = np.where(radius <= scale, tissue, 0.0) + np.where(radius <= 0.25 * scale, organ, 0.0)
+            self.bodies.append(body.astype(np.int16))
+        self.sector = None
+        self.maximum = 4095
+        self.buffer = np.empty((self.rows, self.columns), dtype=np.int16)
+
+    # Pixel bytes for an instance at `position` in [-1, 1] along the series
+    def generate(self, position):
+        level = round((position + 1.0) / 2.0 * (len(self.bodies) - 1))
+        y, x = self.rng.integers(0, self.rows), self.rng.integers(0, self.columns)
+        noise = self.noise[y:y + self.rows, x:x + self.columns]
+        if self.sector is not None:
+            image = self.bodies[level] + noise * self.sector
+        else:
+            image = np.add(self.bodies[level], noise, out=self.buffer)
+        np.clip(image, 0, self.maximum, out=image)
+        return image.astype(self.dtype).tobytes()
+
+
+def pixel_header(spec, length):
+    vr = b'OW' if spec['bits'] == 16 else b'OB'
+    return struct.pack('<HH2sHI', 0x7FE0, 0x0010, vr, 0, length)
+
+
+def shared_attributes(series, spec):
+    ds = Dataset()
+    ds.SOPClassUID = spec['sop_class']
+    ds.StudyDate = series['study_date']
+    ds.SeriesDate = series['study_date']
+    ds.ContentDate = series['study_date']
+    ds.StudyTime = series['study_time']
+    ds.AccessionNumber = series['accession']
+    ds.Modality = series['modality']
+    ds.Manufacturer = "DICOMHawk"
+    ds.InstitutionName = series['institution']
+    ds.ReferringPhysicianName = series['physician']
+    ds.StudyDescription = series['study_description']
+    ds.SeriesDescription = series['series_description']
+    ds.PatientName = series['patient_name']
+    ds.PatientID = series['patient_id']
+    ds.PatientBirthDate = series['birth_date']
+    ds.PatientSex = series['sex']
+    ds.StudyInstanceUID = series['study_uid']
+    ds.SeriesInstanceUID = series['series_uid']
+    ds.StudyID = series['study_id']
+    ds.SeriesNumber = series['series_number']
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.Rows = spec['rows']
+    ds.Columns = spec['columns']
+    ds.BitsAllocated = spec['bits']
+    ds.BitsStored = 12 if spec['bits'] == 16 else 8
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = 0
+    if spec['spacing']:
+        ds.PixelSpacing = [spec['spacing'], spec['spacing']]
+    if spec['thickness']:
+        ds.SliceThickness = spec['thickness']
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    if series['modality'] == 'CT':
+        ds.RescaleIntercept = -1024
+        ds.RescaleSlope = 1
+        ds.WindowCenter = 1064
+        ds.WindowWidth = 400
+    return ds
+
+
+# UIDs derived from the seed when there is one, so a seeded archive gets the
+# same UIDs every time. pydicom joins the entropy sources without a separator,
+# so they are passed as one delimited string that includes the level
+def make_uid(seed, level, *parts):
+    if seed is None:
+        return generate_uid()
+    return generate_uid(entropy_srcs=[f"{seed}|{level}|" + "|".join(map(str, parts))])
+
+
+# Write one series; runs in a worker process
+def write_series(series):
+    spec = MODALITIES[series['modality']]
+    rng = np.random.default_rng(series['seed'])
+    os.makedirs(series['directory'], exist_ok=True)
+
+    chunks = build_header_template(shared_attributes(series, spec))
+    meta = file_meta_template(spec['sop_class'])
+    pixels = PixelGenerator(rng, spec)
+    header = pixel_header(spec, spec['rows'] * spec['columns'] * spec['bits'] // 8)
+    sop_instance_tag, number_tag, position_tag, location_tag = INSTANCE_TAGS
+
+    written = 0
+    count = series['instances']
+    for number in range(1, count + 1):
+        sop_instance_uid = make_uid(series['uid_seed'], 'instance', series['series_uid'], number)
+        # Per-instance elements interleaved with the shared chunks, in tag order
+        parts = [
+            PREAMBLE, encode_file_meta(meta, sop_instance_uid),
+            chunks[0], encode_element(sop_instance_tag, 'UI', sop_instance_uid),
+            chunks[1], encode_element(number_tag, 'IS', str(number)),
+            chunks[2],
+        ]
+        if spec['thickness']:
+            location = format_ds((number - 1) * spec['thickness'])
+            parts.append(encode_element(position_tag, 'DS', f"-180\\-180\\{location}"))
+            parts.append(chunks[3])
+            parts.append(encode_element(location_tag, 'DS', location))
+        else:
+            parts.append(chunks[3])
+        parts.append(chunks[4])
+        position = (2.0 * (number - 1) / (count - 1) - 1.0) if count > 1 else 0.0
+        parts.append(header)
+        parts.append(pixels.generate(position))
+        data = b''.join(parts)
+        with open(os.path.join(series['directory'], f"IMG{number:04d}.dcm"), 'wb') as f:
+            f.write(data)
+        written += len(data)
+    return count, written
+
+
+# Lay out patients, studies and series; cheap, so done up front in the parent
+def plan_archive(output, patients, modalities, seed):
+    rnd = random.Random(seed)
+    today = date.today()
+    plan = []
+    for p in range(1, patients + 1):
+        patient = {
+            'patient_name': f"{rnd.choice(LAST_NAMES)}^{rnd.choice(FIRST_NAMES)}",
+            'patient_id': f"{rnd.randint(10, 31):02d}{rnd.randint(1, 12):02d}{rnd.randint(30, 99):02d}-{rnd.randint(1000, 9999)}",
+            'birth_date': (today - timedelta(days=rnd.randint(18 * 365, 90 * 365))).strftime("%Y%m%d"),
+            'sex': rnd.choice("MF"),
+        }
+        for s in range(1, rnd.randint(1, 3) + 1):
+            modality = rnd.choice(modalities)
+            spec = MODALITIES[modality]
+            study = dict(patient)
+            study.update({
+                'modality': modality,
+                'study_uid': make_uid(seed, 'study', p, s),
+                'study_id': str(rnd.randint(1000, 99999)),
+                'accession': f"A{rnd.randint(10 ** 7, 10 ** 8 - 1)}",
+                'study_date': (today - timedelta(days=rnd.randint(0, 5 * 365))).strftime("%Y%m%d"),
+                'study_time': f"{rnd.randint(7, 18):02d}{rnd.randint(0, 59):02d}{rnd.randint(0, 59):02d}",
+                'study_description': rnd.choice(spec['studies']),
+                'institution': rnd.choice(INSTITUTIONS),
+                'physician': rnd.choice(PHYSICIANS),
+            })
+            for n in range(1, rnd.randint(*spec['series']) + 1):
+                series = dict(study)
+                series.update({
+                    'series_uid': make_uid(seed, 'series', p, s, n),
+                    'series_number': n,
+                    'series_description': f"{study['study_description']} {n}",
+                    'instances': rnd.randint(*spec['instances']),
+                    'seed': rnd.getrandbits(32),
+                    'uid_seed': seed,
+                    'directory': os.path.join(output, f"PAT{p:05d}", f"STU{s:02d}", f"SER{n:02d}"),
+                })
+                plan.append(series)
+    return plan
+
+
+def generate_archive(output, patients, modalities, workers, seed=None):
+    plan = plan_archive(output, patients, modalities, seed)
+    # Largest series first so the pool is not left waiting on one long task
+    plan.sort(key=lambda series: series['instances'] * MODALITIES[series['modality']]['rows'], reverse=True)
+    instances = written = 0
+    if workers <= 1:
+        results = map(write_series, plan)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(write_series, plan)
+    for count, size in results:
+        instances += count
+        written += size
+    if workers > 1:
+        executor.shutdown()
+    return instances, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic decoy DICOM archive.")
+    parser.add_argument('output', help="directory to write the archive to")
+    parser.add_argument('--patients', type=int, default=100, help="number of patients (default: 100)")
+    parser.add_argument('--modalities', default=','.join(MODALITIES),
+                        help=f"comma-separated modalities to draw studies from (default: {','.join(MODALITIES)})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of writer processes (default: CPU count)")
+    parser.add_argument('--seed', type=int, help="seed for a reproducible archive: the same patients, UIDs and images")
+    args = parser.parse_args()
+
+    modalities = args.modalities.split(',')
+    unknown = set(modalities) - set(MODALITIES)
+    if unknown:
+        parser.error(f"unknown modalities: {', '.join(sorted(unknown))}")
+
+    started = time.monotonic()
+    instances, written = generate_archive(args.output, args.patients, modalities, args.workers, args.seed)
+    elapsed = time.monotonic() - started
+    print(f"Wrote {instances} instances ({written / 2 ** 20:.0f} MiB) to {args.output} in {elapsed:.1f}s: "
+          f"{instances / elapsed:.0f} instances/s, {written / 2 ** 20 / elapsed:.0f} MiB/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+import os
+
+# Production server for logserver:app. One process: the log server keeps its
+# simplified log index, live tail reader and event ingest thread in memory, and
+# threads are what long polls and SSE viewers need, since they mostly wait.
+# logserver.py keeps LIVE_MAX_SUBSCRIBERS below this thread count so waiting
+# viewers cannot starve the other routes.
+bind = os.environ.get('LOGSERVER_BIND', '172.29.0.2:5000')
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('LOGSERVER_THREADS', '32'))
+keepalive = 5
+# Log to the container output like the development server did
+accesslog = '-' if os.environ.get('LOGSERVER_ACCESS_LOG', 'false').lower() == 'true' else None
+errorlog = '-'
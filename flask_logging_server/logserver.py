@@ -1,26 +1,96 @@
 import logging
-from logging.handlers import TimedRotatingFileHandler
-from flask import Flask, jsonify, render_template, send_from_directory
+from logging.handlers import WatchedFileHandler
+from flask import Flask, Response, jsonify, render_template, request, send_file, send_from_directory, stream_with_context
+import html
 import os
 import json
+import re
+import glob
+import gzip
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from datetime import datetime, timedelta
 
 
-# Set paths for log files
-log_directory = '/app/logs/'
-simplified_log_directory = '/app/simplified_logs/'
+# Set paths for log files. They are shared with the DICOM server, and
+# DICOMHAWK_DATA_DIR moves them the same way, e.g. for a test run
+data_directory = os.environ.get('DICOMHAWK_DATA_DIR', '/app')
+log_directory = os.path.join(data_directory, 'logs', '')
+simplified_log_directory = os.path.join(data_directory, 'simplified_logs', '')
 
 # Set logging files
 log_file_path = os.path.join(log_directory, 'dicom_server.log')
 simplified_log_file_path = os.path.join(simplified_log_directory, 'dicom_simplified.log')
 exception_log_file_path = os.path.join(log_directory, 'exception.log')
 
+# Persistent byte-offset index of the simplified log segments
+simplified_index_path = os.path.join(simplified_log_directory, 'dicom_simplified.index.json')
+rotations_path = simplified_log_file_path + '.rotations.json'
 
+# Page sizes for the cursored /logs/simplified API
+SIMPLIFIED_PAGE_LIMIT = 500
+SIMPLIFIED_MAX_PAGE_LIMIT = 5000
 
+# Live tail settings: stat polling interval, per-viewer backlog and SSE keepalive
+LIVE_POLL_INTERVAL = 0.25
+LIVE_QUEUE_SIZE = 1000
+LIVE_KEEPALIVE_INTERVAL = 15
+LONG_POLL_MAX_WAIT = 30
+# Each SSE viewer and waiting long poll holds one of gunicorn's
+# LOGSERVER_THREADS threads. Past LIVE_MAX_SUBSCRIBERS of them, SSE requests
+# get a 503 and long polls return at once, leaving threads for the rest of the
+# server; clients retry after LIVE_RETRY_AFTER seconds
+LOGSERVER_THREADS = int(os.environ.get('LOGSERVER_THREADS', '32'))
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_MAX_SUBSCRIBERS', str(max(1, LOGSERVER_THREADS - 8))))
+LIVE_RETRY_AFTER = 5
 
-# Logger setup function
-def setup_logger(name, log_file, level=logging.INFO, when="midnight", interval=1):
-    handler = TimedRotatingFileHandler(log_file, when=when, interval=interval)
-    handler.suffix = "%Y%m%d"
+# JSON responses at least this large are gzipped for clients that accept it
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+
+# Block size for streaming and reverse-scanning the detailed log
+LOG_STREAM_BLOCK_SIZE = 64 * 1024
+
+# SQLite event store the simplified log is ingested into for /events and
+# /sessions, with the entries per ingest transaction and the idle poll interval
+event_db_path = os.path.join(simplified_log_directory, 'dicom_events.sqlite3')
+EVENT_INGEST_BATCH = 5000
+EVENT_INGEST_INTERVAL = 1
+EVENT_PAGE_LIMIT = 500
+EVENT_MAX_PAGE_LIMIT = 5000
+
+# Defaults and limits of the /stats lists and hourly histogram
+STATS_TOP = 10
+STATS_MAX_TOP = 100
+STATS_HOURS = 24
+STATS_MAX_HOURS = 24 * 31
+STATS_TOP_KINDS = (
+    ('ip', 'top_ips'),
+    ('refused_ip', 'top_refused_ips'),
+    ('command', 'commands'),
+    ('find_term', 'find_terms'),
+    ('version', 'client_versions'),
+)
+
+# Prometheus endpoints of the DICOM server (comma separated; with several
+# DICOM workers, one per worker plus the supervisor), summarised on the status page
+DICOM_METRICS_URLS = [url.strip() for url in os.environ.get('DICOM_METRICS_URLS', 'http://172.29.0.3:9112/metrics').split(',') if url.strip()]
+DICOM_METRICS_TIMEOUT = 2
+# Seconds a scrape is served from cache, so status page polls do not each wait
+# on the DICOM server endpoints
+DICOM_METRICS_CACHE_SECONDS = float(os.environ.get('DICOM_METRICS_CACHE_SECONDS', 10))
+
+
+
+# Logger setup function. The DICOM server rotates and archives these files,
+# the log server only appends and reopens them after a rotation
+def setup_logger(name, log_file, level=logging.INFO):
+    handler = WatchedFileHandler(log_file)
     logger = logging.getLogger(name)
     logger.setLevel(level)
     logger.addHandler(handler)
@@ -40,8 +110,665 @@ pynetdicom_logger.addHandler(logging.FileHandler(log_file_path))
 
 
 
+# Simplified log index: inode -> {"path", "size", "lines"}. "size" is the offset
+# just past the last complete line, so partially written lines are never served.
+simplified_index_lock = threading.Lock()
+simplified_index = {}
+
+# Matches the "%Y%m%d" suffix TimedRotatingFileHandler gives rotated files,
+# followed by ".gz" once the DICOM server has compressed them
+rotated_suffix_pattern = re.compile(r'\.\d{8}(\.gz)?$')
+
+# List log segments oldest first: rotated files by date, then the live file.
+# While a rotated file is being compressed both copies exist, the plain one
+# is used until it is removed
+def list_log_segments(path):
+    candidates = sorted(p for p in glob.glob(path + '.*') if rotated_suffix_pattern.search(p[len(path):]))
+    plain = set(candidates)
+    candidates = [p for p in candidates if not (p.endswith('.gz') and p[:-3] in plain)]
+    candidates.append(path)
+    segments = []
+    seen = set()
+    for candidate in candidates:
+        try:
+            st = os.stat(candidate)
+        except FileNotFoundError:
+            continue
+        # The live file may be renamed while we list, so dedupe by inode
+        if st.st_ino in seen:
+            continue
+        seen.add(st.st_ino)
+        segments.append((candidate, st.st_ino, st.st_size))
+    return segments
+
+def load_simplified_index():
+    try:
+        with open(simplified_index_path, 'r') as f:
+            simplified_index.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        exception_logger.error(f"Ignoring unreadable simplified log index: {e}")
+
+# Each writer gets its own temp file, so workers saving at the same time never
+# rename each other's half-written copy into place
+def save_simplified_index():
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile('w', dir=simplified_log_directory, prefix='dicom_simplified.index.',
+                                         suffix='.tmp', delete=False) as f:
+            tmp_path = f.name
+            json.dump(simplified_index, f)
+        os.replace(tmp_path, simplified_index_path)
+    except OSError as e:
+        exception_logger.error(f"Failed to save simplified log index: {e}")
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+# Inodes of the files compressed into each segment, with the decompressed
+# offset their content starts at, as recorded by the DICOM server when it
+# compresses a rotated log: {inode: {"segment": <.gz name>, "base": <offset>}}
+def load_rotations():
+    try:
+        with open(rotations_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        exception_logger.error(f"Ignoring unreadable log rotation record: {e}")
+        return {}
+
+# Index a compressed segment in one pass over its decompressed lines. It keeps
+# the inodes of the plain files it was made from, so cursors into those stay
+# valid even when the plain file was compressed before it was ever indexed here
+def index_compressed_segment(path):
+    entry = {'path': path, 'size': 0, 'lines': 0, 'compressed': True, 'rotated_from': {}}
+    name = os.path.basename(path)
+    for key, rotation in load_rotations().items():
+        if rotation['segment'] == name:
+            entry['rotated_from'][key] = rotation['base']
+    if not entry['rotated_from']:
+        # Compressed before rotations were recorded
+        for key, previous in simplified_index.items():
+            if previous['path'] == path[:-3]:
+                entry['rotated_from'][key] = 0
+    with gzip.open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                entry['lines'] += chunk.count(b'\n')
+                entry['size'] = f.tell() - len(chunk) + newline + 1
+    return entry
+
+# Scan only the bytes appended since the last call and return the indexed segments
+def update_simplified_index():
+    with simplified_index_lock:
+        segments = []
+        updated = {}
+        changed = False
+        for path, inode, size in list_log_segments(simplified_log_file_path):
+            key = str(inode)
+            entry = simplified_index.get(key)
+            if path.endswith('.gz'):
+                # Compressed segments never change once they exist
+                if entry is None or entry['path'] != path or not isinstance(entry.get('rotated_from'), dict):
+                    try:
+                        entry = index_compressed_segment(path)
+                    except FileNotFoundError:
+                        continue
+                    except (OSError, EOFError) as e:
+                        exception_logger.error(f"Skipping unreadable compressed log {path}: {e}")
+                        continue
+                    changed = True
+                updated[key] = entry
+                segments.append({'inode': inode, **entry})
+                continue
+            if entry is None or entry['size'] > size:
+                # New segment, or the inode was reused for a truncated file
+                entry = {'path': path, 'size': 0, 'lines': 0}
+                changed = True
+            if entry['path'] != path:
+                entry['path'] = path
+                changed = True
+            if size > entry['size']:
+                try:
+                    with open(path, 'rb') as f:
+                        if os.fstat(f.fileno()).st_ino == inode:
+                            position = entry['size']
+                            line_end = position
+                            lines = 0
+                            f.seek(position)
+                            while position < size:
+                                chunk = f.read(min(1 << 20, size - position))
+                                if not chunk:
+                                    break
+                                newline = chunk.rfind(b'\n')
+                                if newline >= 0:
+                                    lines += chunk.count(b'\n')
+                                    line_end = position + newline + 1
+                                position += len(chunk)
+                            if line_end > entry['size']:
+                                entry['lines'] += lines
+                                entry['size'] = line_end
+                                changed = True
+                except FileNotFoundError:
+                    continue
+            updated[key] = entry
+            segments.append({'inode': inode, **entry})
+        if changed or len(updated) != len(simplified_index):
+            simplified_index.clear()
+            simplified_index.update(updated)
+            save_simplified_index()
+        return segments
+
+def parse_cursor(cursor):
+    inode, offset = cursor.split(':')
+    inode, offset = int(inode), int(offset)
+    if inode < 0 or offset < 0:
+        raise ValueError(cursor)
+    return inode, offset
+
+def format_cursor(segment, offset):
+    return f"{segment['inode']}:{offset}"
+
+# Decompressing readers left at the offset where the last page ended, so paging
+# through a compressed segment continues where it stopped instead of
+# decompressing it again from the start for every page
+COMPRESSED_READER_CACHE = 4
+compressed_readers_lock = threading.Lock()
+compressed_readers = OrderedDict()
+
+# Open a segment positioned at offset, None if it was rotated since indexing
+def open_segment(segment, offset):
+    if segment.get('compressed'):
+        with compressed_readers_lock:
+            f = compressed_readers.pop((segment['path'], offset), None)
+        if f is None:
+            f = gzip.open(segment['path'], 'rb')
+            f.seek(offset)
+        return f
+    f = open(segment['path'], 'rb')
+    if os.fstat(f.fileno()).st_ino != segment['inode']:
+        f.close()
+        return None
+    f.seek(offset)
+    return f
+
+def release_segment(segment, f):
+    if not segment.get('compressed') or f.closed:
+        f.close()
+        return
+    with compressed_readers_lock:
+        compressed_readers[(segment['path'], f.tell())] = f
+        while len(compressed_readers) > COMPRESSED_READER_CACHE:
+            compressed_readers.popitem(last=False)[1].close()
+
+# Read up to `limit` entries after `cursor`, crossing rotated segments in order.
+# Returns the entries, the next cursor, whether more are waiting, the total
+# number of entries and whether the cursor's segment could not be found
+def read_simplified_page(cursor, limit):
+    segments = update_simplified_index()
+    total = sum(segment['lines'] for segment in segments)
+    if not segments:
+        return [], cursor, False, total, False
+
+    position, offset = 0, 0
+    cursor_lost = False
+    if cursor:
+        inode, cursor_offset = parse_cursor(cursor)
+        base = 0
+        matches = [i for i, segment in enumerate(segments) if segment['inode'] == inode]
+        if not matches:
+            # A cursor into a file that has since been compressed
+            matches = [i for i, segment in enumerate(segments) if str(inode) in segment.get('rotated_from', {})]
+            if matches:
+                base = segments[matches[0]]['rotated_from'][str(inode)]
+        if matches:
+            position = matches[0]
+            segment = segments[position]
+            # A truncated file invalidates the offset, restart the segment
+            offset = base + cursor_offset if base + cursor_offset <= segment['size'] else base
+        else:
+            # Unknown inode, e.g. removed by retention or compressed by a server
+            # that did not record it. Rather than serve every kept segment again,
+            # resume at the start of the live file and say so
+            position = len(segments) - 1
+            cursor_lost = True
+
+    entries = []
+    while len(entries) < limit:
+        segment = segments[position]
+        if offset < segment['size']:
+            try:
+                f = open_segment(segment, offset)
+            except FileNotFoundError:
+                break
+            if f is None:
+                break  # Rotated since indexing, picked up on the next call
+            try:
+                while len(entries) < limit and offset < segment['size']:
+                    raw = f.readline()
+                    if not raw:
+                        break
+                    offset += len(raw)
+                    line = raw.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError as e:
+                        exception_logger.error(f"Invalid JSON in log file: {line} - {e}")
+            finally:
+                release_segment(segment, f)
+        if offset >= segment['size'] and position < len(segments) - 1:
+            position += 1
+            offset = 0
+        else:
+            break
+
+    segment = segments[position]
+    has_more = offset < segment['size'] or position < len(segments) - 1
+    return entries, format_cursor(segment, offset), has_more, total, cursor_lost
+
+load_simplified_index()
+
+EVENT_DB_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT,
+    event_id TEXT,
+    ip TEXT,
+    command TEXT,
+    event TEXT,
+    level TEXT,
+    msg TEXT,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_session ON events (session_id, id);
+CREATE INDEX IF NOT EXISTS events_ip ON events (ip, timestamp);
+CREATE INDEX IF NOT EXISTS events_command ON events (command, timestamp);
+CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    ip TEXT,
+    port INTEGER,
+    version TEXT,
+    status TEXT,
+    first_seen TEXT,
+    last_seen TEXT,
+    events INTEGER NOT NULL,
+    commands INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_ip ON sessions (ip, first_seen);
+CREATE INDEX IF NOT EXISTS sessions_first_seen ON sessions (first_seen);
+CREATE TABLE IF NOT EXISTS ingest_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stat_counts (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS stat_counts_top ON stat_counts (kind, count);
+CREATE TABLE IF NOT EXISTS stat_hours (
+    hour TEXT NOT NULL,
+    command TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (hour, command)
+);
+'''
+
+# Counters behind /stats as (kind, key, count) selects over newly ingested
+# events, so the totals never need a scan of the whole log
+STAT_COUNT_QUERIES = (
+    "SELECT 'totals', 'events', COUNT(*) FROM events WHERE id > ?",
+    "SELECT 'totals', 'associations', COUNT(*) FROM events WHERE id > ? AND event = 'Association requested'",
+    "SELECT 'totals', 'refused', COALESCE(SUM(COALESCE(json_extract(data, '$.Refused'), 1)), 0) FROM events WHERE id > ? AND event = 'Connection refused'",
+    "SELECT 'ip', ip, COUNT(*) FROM events WHERE id > ? AND event = 'Association requested' AND ip IS NOT NULL GROUP BY ip",
+    "SELECT 'refused_ip', ip, SUM(COALESCE(json_extract(data, '$.Refused'), 1)) FROM events WHERE id > ? AND event = 'Connection refused' AND ip IS NOT NULL GROUP BY ip",
+    "SELECT 'command', command, COUNT(*) FROM events WHERE id > ? AND command IS NOT NULL GROUP BY command",
+    "SELECT 'find_term', json_extract(data, '$.Term') AS term, COUNT(*) FROM events WHERE id > ? AND msg = 'C-FIND Search' AND term IS NOT NULL GROUP BY term",
+    "SELECT 'version', json_extract(data, '$.Version') AS version, COUNT(*) FROM events WHERE id > ? AND msg = 'Client' AND version IS NOT NULL GROUP BY version",
+)
+STAT_HOURS_QUERY = "SELECT substr(timestamp, 1, 13), command, COUNT(*) FROM events WHERE id > ? AND command IS NOT NULL AND timestamp IS NOT NULL GROUP BY 1, 2"
+STATS_VERSION = '1'
+
+# Per-session aggregates, updated as each event is ingested
+SESSION_UPSERT = '''
+INSERT INTO sessions (session_id, ip, port, version, status, first_seen, last_seen, events, commands)
+VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+ON CONFLICT (session_id) DO UPDATE SET
+    ip = COALESCE(sessions.ip, excluded.ip),
+    port = COALESCE(sessions.port, excluded.port),
+    version = COALESCE(excluded.version, sessions.version),
+    status = COALESCE(excluded.status, sessions.status),
+    first_seen = COALESCE(MIN(sessions.first_seen, excluded.first_seen), sessions.first_seen, excluded.first_seen),
+    last_seen = COALESCE(MAX(sessions.last_seen, excluded.last_seen), sessions.last_seen, excluded.last_seen),
+    events = sessions.events + 1,
+    commands = sessions.commands + excluded.commands
+'''
+
+def connect_event_db():
+    db = sqlite3.connect(event_db_path, timeout=30, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    return db
+
+def event_row(entry):
+    return (
+        entry.get('session_id'), entry.get('ID'), entry.get('IP'), entry.get('Command'),
+        entry.get('event'), entry.get('level'), entry.get('msg'), entry.get('timestamp'),
+        json.dumps(entry)
+    )
+
+def session_row(entry):
+    port = entry.get('Port')
+    return (
+        entry['session_id'], entry.get('IP'), port if isinstance(port, int) else None,
+        entry.get('Version'), entry.get('Status'), entry.get('timestamp'), entry.get('timestamp'),
+        1 if entry.get('Command') else 0
+    )
+
+# Add the events after after_id to the /stats counters
+def update_stats(db, after_id):
+    for query in STAT_COUNT_QUERIES:
+        db.execute(f"INSERT INTO stat_counts (kind, key, count) {query} ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count", (after_id,))
+    db.execute(f"INSERT INTO stat_hours (hour, command, count) {STAT_HOURS_QUERY} ON CONFLICT (hour, command) DO UPDATE SET count = count + excluded.count", (after_id,))
+
+# Build the counters from events ingested before the stats tables existed
+def backfill_stats(db):
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        row = db.execute("SELECT value FROM ingest_state WHERE name = 'stats_version'").fetchone()
+        if row is None or row['value'] != STATS_VERSION:
+            db.execute('DELETE FROM stat_counts')
+            db.execute('DELETE FROM stat_hours')
+            update_stats(db, 0)
+            db.execute("INSERT OR REPLACE INTO ingest_state (name, value) VALUES ('stats_version', ?)", (STATS_VERSION,))
+        db.execute('COMMIT')
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+
+# Ingest one batch of new simplified log entries. The read cursor is stored
+# with the rows in the same transaction, so entries are never ingested twice,
+# even by several log server processes
+def ingest_events(db):
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        row = db.execute("SELECT value FROM ingest_state WHERE name = 'simplified_cursor'").fetchone()
+        entries, next_cursor, has_more, _, cursor_lost = read_simplified_page(row['value'] if row else None, EVENT_INGEST_BATCH)
+        if cursor_lost:
+            exception_logger.error(f"Event store cursor {row['value']} no longer matches a log segment, resuming at the live log")
+        last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        db.executemany(
+            'INSERT INTO events (session_id, event_id, ip, command, event, level, msg, timestamp, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [event_row(entry) for entry in entries]
+        )
+        db.executemany(SESSION_UPSERT, [session_row(entry) for entry in entries if entry.get('session_id')])
+        if entries:
+            update_stats(db, last_id)
+        if next_cursor:
+            db.execute("INSERT OR REPLACE INTO ingest_state (name, value) VALUES ('simplified_cursor', ?)", (next_cursor,))
+        db.execute('COMMIT')
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    return len(entries), has_more
+
+# Notified after each ingested batch, wakes /events long polls
+events_condition = threading.Condition()
+
+def event_ingest_loop():
+    db = None
+    while True:
+        try:
+            if db is None:
+                db = connect_event_db()
+                db.executescript(EVENT_DB_SCHEMA)
+                backfill_stats(db)
+            ingested, has_more = ingest_events(db)
+            if ingested:
+                with events_condition:
+                    events_condition.notify_all()
+        except (sqlite3.Error, OSError, ValueError) as e:
+            exception_logger.error(f"Error ingesting simplified log into the event store: {e}")
+            if db is not None:
+                db.close()
+            db = None
+            has_more = False
+        if not has_more:
+            time.sleep(EVENT_INGEST_INTERVAL)
+
+threading.Thread(target=event_ingest_loop, name='event-ingest', daemon=True).start()
+
+# Follows one log file by stat polling, surviving TimedRotatingFileHandler rollover
+class LogFollower:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.inode = None
+        self.offset = 0
+        self.partial = b''
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.partial = b''
+
+    def open(self, at_end):
+        self.close()
+        try:
+            self.file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.offset = self.file.seek(0, os.SEEK_END) if at_end else 0
+
+    # Skip everything written so far, used when viewers reconnect after idling
+    def seek_end(self):
+        self.open(at_end=True)
+
+    def drain(self, lines):
+        data = self.file.read()
+        if not data:
+            return
+        data = self.partial + data
+        start = 0
+        newline = data.find(b'\n')
+        while newline >= 0:
+            self.offset += newline + 1 - start
+            lines.append((f"{self.inode}:{self.offset}", data[start:newline].decode('utf-8', 'replace')))
+            start = newline + 1
+            newline = data.find(b'\n', start)
+        self.partial = data[start:]
+
+    # Return (cursor, line) pairs for complete lines written since the last call
+    def read_lines(self):
+        lines = []
+        if self.file is None:
+            # The file appeared after we started following, read it from the start
+            self.open(at_end=False)
+            if self.file is None:
+                return lines
+        self.drain(lines)
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return lines
+        if st.st_ino != self.inode:
+            # Rolled over: finish the renamed file, then follow the new one
+            self.drain(lines)
+            self.open(at_end=False)
+            if self.file is not None:
+                self.drain(lines)
+        elif st.st_size < self.offset + len(self.partial):
+            # Truncated in place
+            self.open(at_end=False)
+            self.drain(lines)
+        return lines
+
+# Find the offset where the last `lines` lines of an open binary file start,
+# scanning backwards block by block so only the tail is ever read
+def find_tail_offset(f, lines):
+    end = f.seek(0, os.SEEK_END)
+    if end == 0 or lines <= 0:
+        return end
+    f.seek(end - 1)
+    # A trailing newline terminates the last line rather than starting a new one
+    needed = lines + 1 if f.read(1) == b'\n' else lines
+    position = end
+    while position > 0:
+        size = min(LOG_STREAM_BLOCK_SIZE, position)
+        position -= size
+        f.seek(position)
+        block = f.read(size)
+        count = block.count(b'\n')
+        if count < needed:
+            needed -= count
+            continue
+        index = len(block)
+        for _ in range(needed):
+            index = block.rindex(b'\n', 0, index)
+        return position + index + 1
+    return 0
+
+# Stream a log file from `offset` as HTML, escaping one block at a time
+def stream_log_html(path, offset):
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+            f.buffer.seek(offset)
+            yield "<pre>"
+            while True:
+                chunk = f.read(LOG_STREAM_BLOCK_SIZE)
+                if not chunk:
+                    break
+                yield html.escape(chunk).replace('\n', '<br>')
+            yield "</pre>"
+    except OSError as e:
+        exception_logger.error(f"Error streaming log file: {e}")
+
+# One shared tail reader feeds every connected viewer through its own queue
+live_condition = threading.Condition()
+live_subscribers = set()
+live_thread = None
+
+def live_tail_loop():
+    followers = {
+        'simplified': LogFollower(simplified_log_file_path),
+        'detailed': LogFollower(log_file_path),
+    }
+    for follower in followers.values():
+        follower.seek_end()
+    while True:
+        with live_condition:
+            if not live_subscribers:
+                # Idle: no viewers, no disk reads until one connects
+                while not live_subscribers:
+                    live_condition.wait()
+                for follower in followers.values():
+                    follower.seek_end()
+        for stream, follower in followers.items():
+            try:
+                lines = follower.read_lines()
+            except OSError as e:
+                exception_logger.error(f"Error tailing {follower.path}: {e}")
+                follower.close()
+                continue
+            if lines:
+                publish_live(stream, lines)
+        time.sleep(LIVE_POLL_INTERVAL)
+
+def publish_live(stream, lines):
+    with live_condition:
+        subscribers = list(live_subscribers)
+    for subscriber in subscribers:
+        try:
+            subscriber.put_nowait((stream, lines))
+        except queue.Full:
+            # Slow viewer: drop it, the client reconnects and resumes by cursor
+            unsubscribe_live(subscriber)
+            with subscriber.mutex:
+                subscriber.queue.clear()
+            subscriber.put_nowait(None)
+
+# Long polls on /events waiting for the ingest thread. They hold a thread
+# too, so they count against LIVE_MAX_SUBSCRIBERS with the live subscribers
+event_waiters = 0
+
+def live_slots_full():
+    return len(live_subscribers) + event_waiters >= LIVE_MAX_SUBSCRIBERS
+
+# Returns False when LIVE_MAX_SUBSCRIBERS requests are already waiting
+def acquire_event_waiter():
+    global event_waiters
+    with live_condition:
+        if live_slots_full():
+            return False
+        event_waiters += 1
+        return True
+
+def release_event_waiter():
+    global event_waiters
+    with live_condition:
+        event_waiters -= 1
+
+# Returns None when LIVE_MAX_SUBSCRIBERS requests are already waiting
+def subscribe_live():
+    global live_thread
+    subscriber = queue.Queue(LIVE_QUEUE_SIZE)
+    with live_condition:
+        if live_slots_full():
+            return None
+        live_subscribers.add(subscriber)
+        if live_thread is None:
+            live_thread = threading.Thread(target=live_tail_loop, name='live-tail', daemon=True)
+            live_thread.start()
+        live_condition.notify_all()
+    return subscriber
+
+def unsubscribe_live(subscriber):
+    with live_condition:
+        live_subscribers.discard(subscriber)
+
+def format_sse(event, data, event_id=None):
+    message = f"event: {event}\n"
+    if event_id:
+        message += f"id: {event_id}\n"
+    return message + f"data: {data}\n\n"
+
 app = Flask(__name__)
 
+# JSON responses get an ETag, so a dashboard poll that finds nothing new is
+# answered with 304 Not Modified, and are gzipped when the client accepts it.
+# Streamed responses (SSE, log files) are passed through untouched
+@app.after_request
+def finish_json_response(response):
+    if response.mimetype != 'application/json' or response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code != 200 or request.method not in ('GET', 'HEAD'):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and response.content_length >= GZIP_MIN_SIZE:
+        # mtime=0 keeps the output, and so the ETag, the same for the same body
+        response.set_data(gzip.compress(response.get_data(), GZIP_LEVEL, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.add_etag()
+    # Cached copies must be revalidated, which is what makes the 304s happen
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/')
 def landing_page():
   
@@ -59,20 +786,223 @@ def logs():
 def status():
     return jsonify({"status": "running"})
 
+metric_line_pattern = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+metric_label_pattern = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+# Parse Prometheus text exposition into {(name, ((label, value), ...)): value}
+def parse_metrics(text, samples):
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = metric_line_pattern.match(line)
+        if match is None:
+            continue
+        name, labels, value = match.groups()
+        labels = tuple(sorted(metric_label_pattern.findall(labels or '')))
+        try:
+            samples[(name, labels)] = samples.get((name, labels), 0) + float(value)
+        except ValueError:
+            continue
+
+# Mean and upper bound of the 95th percentile bucket of a histogram, in ms
+def summarise_histogram(samples, name, labels):
+    count = samples.get((f"{name}_count", labels), 0)
+    if not count:
+        return {"count": 0, "mean_ms": None, "p95_ms": None}
+    buckets = sorted(
+        (float(dict(key[1])['le']), value) for key, value in samples.items()
+        if key[0] == f"{name}_bucket" and tuple(pair for pair in key[1] if pair[0] != 'le') == labels
+    )
+    p95 = next((bound for bound, cumulative in buckets if cumulative >= 0.95 * count), None)
+    return {
+        "count": int(count),
+        "mean_ms": round(samples.get((f"{name}_sum", labels), 0) / count * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2) if p95 is not None and p95 != float('inf') else None,
+    }
+
+# Last scrape of DICOM_METRICS_URLS as (monotonic time, summary); the lock
+# keeps concurrent requests from scraping at the same time
+dicom_metrics_cache = None
+dicom_metrics_lock = threading.Lock()
+
+# Scrape DICOM_METRICS_URLS and sum the handler metrics into one summary
+def scrape_dicom_metrics():
+    samples = {}
+    sources = []
+    for url in DICOM_METRICS_URLS:
+        try:
+            with urllib.request.urlopen(url, timeout=DICOM_METRICS_TIMEOUT) as response:
+                parse_metrics(response.read().decode('utf-8', 'replace'), samples)
+            sources.append({"url": url, "up": True})
+        except (OSError, ValueError) as e:
+            sources.append({"url": url, "up": False, "error": str(e)})
+
+    def total(name, labels=()):
+        return int(samples.get((name, labels), 0))
+
+    handlers = []
+    for name, labels in sorted(key for key in samples if key[0] == 'dicomhawk_handler_calls_total'):
+        handlers.append({
+            **dict(labels),
+            "calls": total(name, labels),
+            "errors": total('dicomhawk_handler_errors_total', labels),
+            "responses": total('dicomhawk_handler_responses_total', labels),
+            **summarise_histogram(samples, 'dicomhawk_handler_duration_seconds', labels),
+        })
+    return {
+        "sources": sources,
+        "handlers": handlers,
+        "associations": {
+            dict(labels)['outcome']: int(value) for (name, labels), value in samples.items()
+            if name == 'dicomhawk_associations_total'
+        },
+        "association_setup": summarise_histogram(samples, 'dicomhawk_association_setup_seconds', ()),
+        "associations_open": total('dicomhawk_associations_open'),
+        "bytes_sent": total('dicomhawk_bytes_sent_total'),
+        "bytes_received": total('dicomhawk_bytes_received_total'),
+        "log_queue_depth": total('dicomhawk_log_queue_depth'),
+        "log_records_written": total('dicomhawk_log_records_written_total'),
+        "log_records_dropped": total('dicomhawk_log_records_dropped_total'),
+        "scraped_at": datetime.now().isoformat(timespec='seconds'),
+    }
+
+# DICOM server handler metrics, served from the last scrape while it is younger
+# than DICOM_METRICS_CACHE_SECONDS. While one request refreshes an expired
+# scrape, the others get the previous one instead of waiting
+@app.route('/dicom_metrics')
+def dicom_metrics():
+    global dicom_metrics_cache
+    cached = dicom_metrics_cache
+    if cached is not None and time.monotonic() - cached[0] < DICOM_METRICS_CACHE_SECONDS:
+        return jsonify(cached[1])
+    if not dicom_metrics_lock.acquire(blocking=cached is None):
+        return jsonify(cached[1])
+    try:
+        cached = dicom_metrics_cache
+        if cached is None or time.monotonic() - cached[0] >= DICOM_METRICS_CACHE_SECONDS:
+            cached = dicom_metrics_cache = (time.monotonic(), scrape_dicom_metrics())
+    finally:
+        dicom_metrics_lock.release()
+    return jsonify(cached[1])
+
+# Overview for the status page from the counters kept by the event store:
+# totals, the ?top=N source IPs, refused IPs, commands, C-FIND terms and
+# client versions, and commands per hour over the last ?hours=N hours
+@app.route('/stats')
+def stats():
+    try:
+        top = max(1, min(int(request.args.get('top', STATS_TOP)), STATS_MAX_TOP))
+        hours = max(1, min(int(request.args.get('hours', STATS_HOURS)), STATS_MAX_HOURS))
+    except ValueError:
+        return jsonify({"error": "Invalid top or hours"}), 400
+    since = (datetime.now() - timedelta(hours=hours - 1)).strftime('%Y-%m-%dT%H')
+    result = {"totals": {"events": 0, "associations": 0, "refused": 0}}
+    db = connect_event_db()
+    try:
+        for row in db.execute("SELECT key, count FROM stat_counts WHERE kind = 'totals'"):
+            result["totals"][row['key']] = row['count']
+        for kind, name in STATS_TOP_KINDS:
+            result[name] = [
+                {"key": row['key'], "count": row['count']}
+                for row in db.execute('SELECT key, count FROM stat_counts WHERE kind = ? ORDER BY count DESC LIMIT ?', (kind, top))
+            ]
+        per_hour = {}
+        for row in db.execute('SELECT hour, command, count FROM stat_hours WHERE hour >= ? ORDER BY hour', (since,)):
+            per_hour.setdefault(row['hour'], {})[row['command']] = row['count']
+        result["commands_per_hour"] = [{"hour": hour, "commands": commands} for hour, commands in per_hour.items()]
+    except sqlite3.OperationalError as e:
+        exception_logger.error(f"Error querying event store: {e}")
+        return jsonify({"error": "Statistics not available yet"}), 503
+    finally:
+        db.close()
+    return jsonify(result)
+
+# Detailed log, streamed. ?tail=N limits it to the last N lines and
+# ?format=raw serves plain text, honouring HTTP Range requests
 @app.route('/logs/all')
 def all_logs():
     try:
         if not os.path.exists(log_file_path):
             return jsonify({"error": "Log file does not exist"}), 404
-        with open(log_file_path, 'r') as f:
-            log_content = f.read().replace('\n', '<br>')
-        return f"<pre>{log_content}</pre>"
+        tail = request.args.get('tail')
+        offset = 0
+        if tail is not None:
+            try:
+                tail = int(tail)
+            except ValueError:
+                return jsonify({"error": "Invalid tail"}), 400
+            with open(log_file_path, 'rb') as f:
+                offset = find_tail_offset(f, tail)
+        if request.args.get('format') == 'raw':
+            if offset == 0:
+                return send_file(log_file_path, mimetype='text/plain', conditional=True, etag=False)
+            def stream_raw():
+                with open(log_file_path, 'rb') as f:
+                    f.seek(offset)
+                    while True:
+                        chunk = f.read(LOG_STREAM_BLOCK_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+            return Response(stream_raw(), mimetype='text/plain')
+        return Response(stream_log_html(log_file_path, offset), mimetype='text/html')
     except Exception as e:
         exception_logger.error(f"Error reading log file: {e}")
         return jsonify({"error": "Internal Server Error"}), 500
 
+# Rotated log files of every log, oldest first
+def list_archived_logs():
+    archived = {}
+    for path in (log_file_path, simplified_log_file_path, exception_log_file_path):
+        for segment_path, _, size in list_log_segments(path)[:-1]:
+            archived[os.path.basename(segment_path)] = (segment_path, size)
+    return archived
+
+@app.route('/logs/archive')
+def archived_logs():
+    return jsonify([
+        {"name": name, "size": size, "compressed": name.endswith('.gz')}
+        for name, (_, size) in list_archived_logs().items()
+    ])
+
+# One rotated log as plain text, decompressed while it is streamed. ?q=<text>
+# returns only the lines containing the text
+@app.route('/logs/archive/<name>')
+def archived_log(name):
+    archived = list_archived_logs().get(name)
+    if archived is None:
+        return jsonify({"error": "Not Found"}), 404
+    path = archived[0]
+    query = request.args.get('q', '').encode('utf-8')
+
+    def stream_archive():
+        try:
+            with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as f:
+                if not query:
+                    while True:
+                        chunk = f.read(LOG_STREAM_BLOCK_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+                    return
+                matched = []
+                for line in f:
+                    if query in line:
+                        matched.append(line)
+                        if len(matched) >= 256:
+                            yield b''.join(matched)
+                            matched = []
+                if matched:
+                    yield b''.join(matched)
+        except (OSError, EOFError) as e:
+            exception_logger.error(f"Error streaming archived log {path}: {e}")
+
+    return Response(stream_archive(), mimetype='text/plain')
+
 @app.route('/logs/simplified')
 def simplified_logs():
+    if 'since' in request.args or 'limit' in request.args:
+        return simplified_logs_page_api()
     try:
         if not os.path.exists(simplified_log_file_path):
             return jsonify([])  # Return an empty list if the log file does not exist
@@ -91,6 +1021,240 @@ def simplified_logs():
         exception_logger.error(f"Error reading simplified log file: {e}")
         return jsonify([])  # Return an empty list in case of error
 
+# Cursored variant: ?since=<cursor>&limit=<n> returns only entries after the cursor
+def simplified_logs_page_api():
+    try:
+        limit = int(request.args.get('limit', SIMPLIFIED_PAGE_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    limit = max(1, min(limit, SIMPLIFIED_MAX_PAGE_LIMIT))
+    try:
+        wait = min(float(request.args.get('wait', 0)), LONG_POLL_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "Invalid wait"}), 400
+    since = request.args.get('since')
+    subscriber = None
+    try:
+        entries, next_cursor, has_more, total, cursor_lost = read_simplified_page(since, limit)
+        if not entries and not cursor_lost and wait > 0:
+            subscriber = subscribe_live()
+        if subscriber is not None:
+            # Long poll: block on the shared tail reader until something is written
+            try:
+                entries, next_cursor, has_more, total, cursor_lost = read_simplified_page(since, limit)
+                deadline = time.monotonic() + wait
+                while not entries and time.monotonic() < deadline:
+                    try:
+                        item = subscriber.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None or item[0] == 'simplified':
+                        entries, next_cursor, has_more, total, cursor_lost = read_simplified_page(since, limit)
+            finally:
+                unsubscribe_live(subscriber)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    response = jsonify({
+        "entries": entries,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+        "total": total,
+        "cursor_lost": cursor_lost
+    })
+    if not entries and not cursor_lost and wait > 0 and subscriber is None:
+        # Too many live viewers to wait here: ask the client to poll later
+        response.headers['Retry-After'] = str(LIVE_RETRY_AFTER)
+    return response
+
+# Server-sent events live tail, ?streams=simplified,detailed&since=<cursor>
+@app.route('/logs/stream')
+def stream_logs():
+    streams = set(request.args.get('streams', 'simplified').split(','))
+    if not streams or not streams <= {'simplified', 'detailed'}:
+        return jsonify({"error": "Invalid streams"}), 400
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        if since:
+            parse_cursor(since)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    # Subscribe before replaying so nothing written in between is lost
+    subscriber = subscribe_live()
+    if subscriber is None:
+        response = jsonify({
+            "error": "Too many live viewers, poll /logs/simplified?since=<cursor> instead",
+            "retry_after": LIVE_RETRY_AFTER
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(LIVE_RETRY_AFTER)
+        return response
+
+    def generate():
+        try:
+            replayed = None
+            if since and 'simplified' in streams:
+                cursor, has_more = since, True
+                while has_more:
+                    entries, cursor, has_more, _, _ = read_simplified_page(cursor, SIMPLIFIED_MAX_PAGE_LIMIT)
+                    for entry in entries:
+                        yield format_sse('simplified', json.dumps(entry))
+                    if entries or not has_more:
+                        yield format_sse('cursor', cursor, cursor)
+                replayed = parse_cursor(cursor)
+            while True:
+                try:
+                    item = subscriber.get(timeout=LIVE_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    return
+                stream, lines = item
+                if stream not in streams:
+                    continue
+                for cursor, line in lines:
+                    if stream == 'simplified':
+                        if replayed is not None:
+                            inode, offset = parse_cursor(cursor)
+                            if inode == replayed[0] and offset <= replayed[1]:
+                                continue  # Already sent by the replay
+                        yield format_sse(stream, line, cursor)
+                    else:
+                        yield format_sse(stream, line)
+        finally:
+            unsubscribe_live(subscriber)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Query helpers for the event store endpoints
+def parse_limit():
+    limit = int(request.args.get('limit', EVENT_PAGE_LIMIT))
+    return max(1, min(limit, EVENT_MAX_PAGE_LIMIT))
+
+def time_range_clauses(column, clauses, params):
+    if request.args.get('from'):
+        clauses.append(f"{column} >= ?")
+        params.append(request.args['from'])
+    if request.args.get('to'):
+        clauses.append(f"{column} <= ?")
+        params.append(request.args['to'])
+
+# Ingested events, oldest first. Filters: ip, command, session, event, level
+# and a from/to timestamp range (ISO 8601, prefixes like 2024-05-01 work).
+# Page with ?after=<next_cursor> and ?limit=; ?wait=<seconds> turns a poll
+# that finds nothing into a long poll until new events are ingested
+@app.route('/events')
+def events():
+    try:
+        limit = parse_limit()
+        after = int(request.args.get('after', 0))
+        wait = min(float(request.args.get('wait', 0)), LONG_POLL_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "Invalid limit, cursor or wait"}), 400
+    clauses, params = ['id > ?'], [after]
+    for arg, column in (('ip', 'ip'), ('command', 'command'), ('session', 'session_id'), ('event', 'event'), ('level', 'level')):
+        if request.args.get(arg):
+            clauses.append(f"{column} = ?")
+            params.append(request.args[arg])
+    time_range_clauses('timestamp', clauses, params)
+    query = f"SELECT id, data FROM events WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?"
+    db = connect_event_db()
+    try:
+        rows = db.execute(query, params + [limit + 1]).fetchall()
+        waiting = not rows and wait > 0 and acquire_event_waiter()
+        if waiting:
+            # The ingest thread may run in another process, so check the store
+            # at least every EVENT_INGEST_INTERVAL as well as when notified
+            try:
+                deadline = time.monotonic() + wait
+                while not rows and time.monotonic() < deadline:
+                    with events_condition:
+                        events_condition.wait(min(EVENT_INGEST_INTERVAL, max(0, deadline - time.monotonic())))
+                    rows = db.execute(query, params + [limit + 1]).fetchall()
+            finally:
+                release_event_waiter()
+    except sqlite3.OperationalError as e:
+        exception_logger.error(f"Error querying event store: {e}")
+        return jsonify({"events": [], "next_cursor": after, "has_more": False})
+    finally:
+        db.close()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    response = jsonify({
+        "events": [json.loads(row['data']) for row in rows],
+        "next_cursor": rows[-1]['id'] if rows else after,
+        "has_more": has_more
+    })
+    if not rows and wait > 0 and not waiting:
+        # Too many live viewers to wait here: ask the client to poll later
+        response.headers['Retry-After'] = str(LIVE_RETRY_AFTER)
+    return response
+
+# Sessions with their event and command counts, newest first. Filters: ip and
+# a from/to range on the session start. Page with ?before=<next_cursor>.
+# last_event_id is the newest event counted in them, from the same snapshot,
+# for following later events with /events?after=
+@app.route('/sessions')
+def sessions():
+    try:
+        limit = parse_limit()
+        before = request.args.get('before')
+        before = int(before) if before else None
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    clauses, params = [], []
+    if before is not None:
+        clauses.append('rowid < ?')
+        params.append(before)
+    if request.args.get('ip'):
+        clauses.append('ip = ?')
+        params.append(request.args['ip'])
+    time_range_clauses('first_seen', clauses, params)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    db = connect_event_db()
+    try:
+        db.execute('BEGIN')
+        rows = db.execute(f"SELECT rowid, * FROM sessions {where} ORDER BY rowid DESC LIMIT ?", params + [limit + 1]).fetchall()
+        last_event_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        db.execute('COMMIT')
+    except sqlite3.OperationalError as e:
+        exception_logger.error(f"Error querying event store: {e}")
+        return jsonify({"sessions": [], "next_cursor": before, "has_more": False, "last_event_id": 0})
+    finally:
+        db.close()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        "sessions": [{key: row[key] for key in row.keys() if key != 'rowid'} for row in rows],
+        "next_cursor": rows[-1]['rowid'] if rows else before,
+        "has_more": has_more,
+        "last_event_id": last_event_id
+    })
+
+# One session's aggregates and its events
+@app.route('/sessions/<session_id>')
+def session_detail(session_id):
+    try:
+        limit = parse_limit()
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    db = connect_event_db()
+    try:
+        session = db.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+        rows = db.execute('SELECT data FROM events WHERE session_id = ? ORDER BY id LIMIT ?', (session_id, limit)).fetchall()
+    except sqlite3.OperationalError as e:
+        exception_logger.error(f"Error querying event store: {e}")
+        session, rows = None, []
+    finally:
+        db.close()
+    if session is None:
+        return jsonify({"error": "Not Found"}), 404
+    return jsonify({**dict(session), "entries": [json.loads(row['data']) for row in rows]})
+
 @app.route('/logs/simplified_page')
 def simplified_logs_page():
     return render_template('simplified_logs.html')
@@ -109,4 +1273,7 @@ def handle_exception(e):
     exception_logger.error(f"Unhandled exception: {e}")
     return jsonify({"error": "Internal Server Error"}), 500
 
-app.run(host='172.29.0.2',debug=True,port=5000)
\ No newline at end of file
+# Development server with the debugger and reloader; in the container the app
+# is served by gunicorn, see gunicorn.conf.py
+if __name__ == '__main__':
+    app.run(host='172.29.0.2',debug=True,port=5000)
\ No newline at end of file
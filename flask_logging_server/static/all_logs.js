@@ -1,16 +1,39 @@
 document.addEventListener("DOMContentLoaded", function () {
+    const logs = document.getElementById('logs');
+
     function fetchLogs() {
-        fetch('/logs/all')
+        return fetch('/logs/all?tail=2000')
             .then(response => response.text())
             .then(data => {
-                document.getElementById('logs').innerHTML = data;
+                logs.innerHTML = data;
             })
             .catch(error => console.error('Error fetching logs:', error));
     }
 
-    // Fetch logs initially
-    fetchLogs();
+    // Append lines pushed by the log server as they are written
+    function followLogs() {
+        const source = new EventSource('/logs/stream?streams=detailed');
+        source.addEventListener('detailed', event => {
+            logs.appendChild(document.createTextNode(event.data));
+            logs.appendChild(document.createElement('br'));
+        });
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                // Refused, e.g. 503 when the server has too many live viewers
+                setInterval(fetchLogs, 5000);
+            } else {
+                console.error('Log stream interrupted, reconnecting');
+            }
+        };
+    }
 
-    // Set interval to fetch logs every 5 seconds
-    setInterval(fetchLogs, 5000);
+    // Fetch logs initially, then follow new lines
+    fetchLogs().then(() => {
+        if (window.EventSource) {
+            followLogs();
+        } else {
+            // Set interval to fetch logs every 5 seconds
+            setInterval(fetchLogs, 5000);
+        }
+    });
 });
@@ -1,93 +1,260 @@
 document.addEventListener("DOMContentLoaded", function () {
-    function fetchLogs() {
-        fetch('/logs/simplified')
-            .then(response => response.json())
-            .then(logs => {
-                const tbody = document.querySelector("#logs-table tbody");
-                tbody.innerHTML = ''; // Clear existing logs
-
-                // Group logs by session_id
-                const groupedLogs = logs.reduce((acc, log) => {
-                    const sessionId = log.session_id || 'N/A';
-                    if (!acc[sessionId]) {
-                        acc[sessionId] = [];
+    const tbody = document.querySelector("#logs-table tbody");
+    const form = document.getElementById("filters");
+    const loadMore = document.getElementById("load-more");
+    const SESSION_PAGE_LIMIT = 50;
+    const EVENT_PAGE_LIMIT = 500;
+    const LONG_POLL_WAIT = 25;
+    const RETRY_INTERVAL = 5000;
+
+    // Without filters the table lists sessions from /sessions, newest first,
+    // and a session's events are fetched from /sessions/<id> when it is
+    // clicked. With filters it lists the matching events from /events. Either
+    // way, new events are followed with a long poll on /events from the id of
+    // the last event seen, so only what changed is fetched.
+    let filters = new URLSearchParams();
+    // Next page: older sessions (before=) or later events (after=)
+    let cursor = "";
+    let hasMore = false;
+    // Id of the last event reflected on the page, followed with /events?after=
+    let lastEventId = null;
+    // Sessions on the page by id: header row and event rows when expanded
+    let sessions = {};
+    // Bumped whenever the table is reset, so late responses are ignored
+    let view = 0;
+
+    function fetchJSON(url) {
+        return fetch(url).then(response => {
+            if (!response.ok) {
+                throw new Error(`${url}: ${response.status}`);
+            }
+            return response.json().then(data => [data, response.headers.get("Retry-After")]);
+        });
+    }
+
+    function createRow(log) {
+        const row = document.createElement("tr");
+        const fields = [
+            log.ID, log.IP, log.Port, log.Version, log.Command, log.Type,
+            log.Term, log.Matches, log.Status, log.level, log.msg, log.timestamp
+        ];
+        fields.forEach(value => {
+            const cell = document.createElement("td");
+            cell.textContent = value || "N/A";
+            row.appendChild(cell);
+        });
+        return row;
+    }
+
+    function sessionLabel(session) {
+        return `Session ID: ${session.session_id} - ${session.ip || "N/A"}:${session.port || "N/A"}, ` +
+            `${session.events} events, ${session.commands} commands, ` +
+            `${session.first_seen || "N/A"} to ${session.last_seen || "N/A"}`;
+    }
+
+    function createSession(session) {
+        const row = document.createElement("tr");
+        row.className = "session-row";
+        const cell = document.createElement("td");
+        cell.colSpan = 12;
+        row.appendChild(cell);
+        const shown = {row: row, cell: cell, eventRows: null};
+        row.addEventListener("click", () => toggleSession(session.session_id));
+        sessions[session.session_id] = shown;
+        cell.textContent = sessionLabel(session);
+        return shown;
+    }
+
+    function removeEventRows(shown) {
+        (shown.eventRows || []).forEach(row => row.remove());
+        shown.eventRows = null;
+    }
+
+    // Fetch a shown session's counts, and its events when it is expanded
+    function refreshSession(sessionId) {
+        const current = view;
+        const expanded = sessions[sessionId].eventRows !== null;
+        const limit = expanded ? EVENT_PAGE_LIMIT : 1;
+        return fetchJSON(`/sessions/${encodeURIComponent(sessionId)}?limit=${limit}`)
+            .then(([session]) => {
+                const shown = sessions[sessionId];
+                if (current !== view || !shown) {
+                    return;
+                }
+                shown.cell.textContent = sessionLabel(session);
+                if (expanded && shown.eventRows !== null) {
+                    removeEventRows(shown);
+                    shown.eventRows = session.entries.map(createRow);
+                    shown.row.after(...shown.eventRows);
+                }
+            })
+            .catch(error => console.error("Error fetching session:", error));
+    }
+
+    function toggleSession(sessionId) {
+        const shown = sessions[sessionId];
+        if (shown.eventRows) {
+            removeEventRows(shown);
+        } else {
+            shown.eventRows = [];
+            refreshSession(sessionId);
+        }
+    }
+
+    function setNextPage(page) {
+        cursor = page.next_cursor || cursor;
+        hasMore = page.has_more;
+        loadMore.hidden = !hasMore;
+    }
+
+    // Next page of older sessions, appended below the ones shown
+    function loadSessions() {
+        const current = view;
+        const params = new URLSearchParams({limit: SESSION_PAGE_LIMIT});
+        if (cursor) {
+            params.set("before", cursor);
+        }
+        return fetchJSON(`/sessions?${params}`)
+            .then(([page]) => {
+                if (current !== view) {
+                    return;
+                }
+                page.sessions.forEach(session => {
+                    if (!sessions[session.session_id]) {
+                        tbody.appendChild(createSession(session).row);
+                    }
+                });
+                setNextPage(page);
+                if (lastEventId === null) {
+                    // Counts on the first page include events up to here
+                    lastEventId = page.last_event_id;
+                    follow(current);
+                }
+            });
+    }
+
+    // Sessions started since the page was loaded go on top
+    function addNewSessions() {
+        const current = view;
+        return fetchJSON(`/sessions?limit=${SESSION_PAGE_LIMIT}`)
+            .then(([page]) => {
+                if (current !== view) {
+                    return;
+                }
+                page.sessions.slice().reverse().forEach(session => {
+                    if (!sessions[session.session_id]) {
+                        tbody.prepend(createSession(session).row);
                     }
-                    acc[sessionId].push(log);
-                    return acc;
-                }, {});
-
-                // Display grouped logs
-                for (const [sessionId, sessionLogs] of Object.entries(groupedLogs)) {
-                    // Create a row for the session_id
-                    const sessionRow = document.createElement("tr");
-                    const sessionCell = document.createElement("td");
-                    sessionCell.textContent = `Session ID: ${sessionId}`;
-                    sessionCell.colSpan = 12;
-                    sessionCell.style.fontWeight = 'bold';
-                    sessionRow.appendChild(sessionCell);
-                    tbody.appendChild(sessionRow);
-
-                    sessionLogs.forEach(log => {
-                        const row = document.createElement("tr");
-
-                        const idCell = document.createElement("td");
-                        idCell.textContent = log.ID || "N/A";
-                        row.appendChild(idCell);
-
-                        const ipCell = document.createElement("td");
-                        ipCell.textContent = log.IP || "N/A";
-                        row.appendChild(ipCell);
-
-                        const portCell = document.createElement("td");
-                        portCell.textContent = log.Port || "N/A";
-                        row.appendChild(portCell);
-
-                        const versionCell = document.createElement("td");
-                        versionCell.textContent = log.Version || "N/A";
-                        row.appendChild(versionCell);
-
-                        const commandCell = document.createElement("td");
-                        commandCell.textContent = log.Command || "N/A";
-                        row.appendChild(commandCell);
-
-                        const typeCell = document.createElement("td");
-                        typeCell.textContent = log.Type || "N/A";
-                        row.appendChild(typeCell);
-
-                        const termCell = document.createElement("td");
-                        termCell.textContent = log.Term || "N/A";
-                        row.appendChild(termCell);
-
-                        const matchesCell = document.createElement("td");
-                        matchesCell.textContent = log.Matches || "N/A";
-                        row.appendChild(matchesCell);
-
-                        const statusCell = document.createElement("td");
-                        statusCell.textContent = log.Status || "N/A";
-                        row.appendChild(statusCell);
-
-                        const levelCell = document.createElement("td");
-                        levelCell.textContent = log.level || "N/A";
-                        row.appendChild(levelCell);
-
-                        const msgCell = document.createElement("td");
-                        msgCell.textContent = log.msg || "N/A";
-                        row.appendChild(msgCell);
-
-                        const timeCell = document.createElement("td");
-                        timeCell.textContent = log.timestamp || "N/A";
-                        row.appendChild(timeCell);
-
-                        tbody.appendChild(row);
-                    });
+                });
+            });
+    }
+
+    // Update every shown session the new events belong to, and add new ones.
+    // Sessions further down that are not loaded yet are up to date once
+    // "Load more" reaches them
+    function applySessionEvents(events) {
+        const touched = new Set(events.map(event => event.session_id).filter(Boolean));
+        const updates = [];
+        let added = false;
+        touched.forEach(sessionId => {
+            if (sessions[sessionId]) {
+                updates.push(refreshSession(sessionId));
+            } else {
+                added = true;
+            }
+        });
+        if (added) {
+            updates.push(addNewSessions());
+        }
+        return Promise.all(updates);
+    }
+
+    // Next page of matching events, oldest first
+    function loadEvents() {
+        const current = view;
+        const params = new URLSearchParams(filters);
+        params.set("limit", EVENT_PAGE_LIMIT);
+        if (cursor) {
+            params.set("after", cursor);
+        }
+        return fetchJSON(`/events?${params}`)
+            .then(([page]) => {
+                if (current !== view) {
+                    return;
+                }
+                page.events.forEach(event => tbody.appendChild(createRow(event)));
+                setNextPage(page);
+                if (!hasMore && lastEventId === null) {
+                    // All matching events are shown, follow new ones from here
+                    lastEventId = cursor || 0;
+                    follow(current);
+                }
+            });
+    }
+
+    // Long poll /events for events after lastEventId until the view changes
+    function follow(current) {
+        if (current !== view) {
+            return;
+        }
+        const params = new URLSearchParams(filters);
+        params.set("after", lastEventId);
+        params.set("limit", EVENT_PAGE_LIMIT);
+        params.set("wait", LONG_POLL_WAIT);
+        fetchJSON(`/events?${params}`)
+            .then(([page, retryAfter]) => {
+                if (current !== view) {
+                    return null;
                 }
+                lastEventId = page.next_cursor;
+                let applied = null;
+                if (filters.toString()) {
+                    page.events.forEach(event => tbody.appendChild(createRow(event)));
+                } else {
+                    applied = applySessionEvents(page.events);
+                }
+                // The server has too many live viewers to hold this poll
+                const delay = retryAfter && !page.events.length ? retryAfter * 1000 : 0;
+                return Promise.resolve(applied).then(() => setTimeout(() => follow(current), delay));
             })
-            .catch(error => console.error('Error fetching simplified logs:', error));
+            .catch(error => {
+                console.error("Error following simplified logs:", error);
+                setTimeout(() => follow(current), RETRY_INTERVAL);
+            });
+    }
+
+    function reload() {
+        view += 1;
+        cursor = "";
+        hasMore = false;
+        lastEventId = null;
+        sessions = {};
+        tbody.replaceChildren();
+        loadMore.hidden = true;
+        const load = filters.toString() ? loadEvents : loadSessions;
+        load().catch(error => console.error("Error fetching simplified logs:", error));
     }
 
-    // Fetch logs initially
-    fetchLogs();
+    form.addEventListener("submit", event => {
+        event.preventDefault();
+        filters = new URLSearchParams();
+        new FormData(form).forEach((value, key) => {
+            if (value.trim()) {
+                filters.set(key, value.trim());
+            }
+        });
+        reload();
+    });
+
+    form.addEventListener("reset", () => {
+        filters = new URLSearchParams();
+        reload();
+    });
+
+    loadMore.addEventListener("click", () => {
+        const load = filters.toString() ? loadEvents : loadSessions;
+        load().catch(error => console.error("Error fetching simplified logs:", error));
+    });
 
-    // Set interval to fetch logs every 5 seconds
-    setInterval(fetchLogs, 5000);
+    reload();
 });
@@ -0,0 +1,101 @@
+document.addEventListener("DOMContentLoaded", function () {
+    const status = document.getElementById("status");
+    const container = document.getElementById("stats-container");
+
+    const sections = [
+        ["top_ips", "Top source IPs"],
+        ["top_refused_ips", "Refused source IPs"],
+        ["commands", "Commands"],
+        ["find_terms", "C-FIND search terms"],
+        ["client_versions", "Client implementation versions"]
+    ];
+
+    function createTable(title, header, rows) {
+        const section = document.createElement("div");
+        const heading = document.createElement("h2");
+        heading.textContent = title;
+        section.appendChild(heading);
+        const table = document.createElement("table");
+        [header].concat(rows).forEach((values, index) => {
+            const row = document.createElement("tr");
+            values.forEach(value => {
+                const cell = document.createElement(index === 0 ? "th" : "td");
+                cell.textContent = value;
+                row.appendChild(cell);
+            });
+            table.appendChild(row);
+        });
+        section.appendChild(table);
+        return section;
+    }
+
+    function renderStats(stats) {
+        container.textContent = "";
+        const totals = stats.totals;
+        container.appendChild(createTable("Totals", ["Events", "Associations", "Refused connections"],
+            [[totals.events, totals.associations, totals.refused]]));
+        sections.forEach(([key, title]) => {
+            container.appendChild(createTable(title, ["Value", "Count"],
+                stats[key].map(item => [item.key, item.count])));
+        });
+        const commands = stats.commands.map(item => item.key);
+        container.appendChild(createTable("Commands per hour", ["Hour"].concat(commands),
+            stats.commands_per_hour.map(bucket =>
+                [bucket.hour].concat(commands.map(command => bucket.commands[command] || 0)))));
+    }
+
+    function formatMs(value) {
+        return value === null ? "N/A" : value;
+    }
+
+    function renderMetrics(data) {
+        let section = document.getElementById("metrics-container");
+        if (!section) {
+            section = document.createElement("div");
+            section.id = "metrics-container";
+            container.after(section);
+        }
+        section.textContent = "";
+        const down = data.sources.filter(source => !source.up);
+        if (down.length === data.sources.length) {
+            return;
+        }
+        const setup = data.association_setup;
+        section.appendChild(createTable("DICOM server", [
+            "Open associations", "Setup mean ms", "Setup p95 ms", "Bytes sent", "Bytes received",
+            "Log queue depth", "Log records written", "Log records dropped"
+        ], [[
+            data.associations_open, formatMs(setup.mean_ms), formatMs(setup.p95_ms), data.bytes_sent,
+            data.bytes_received, data.log_queue_depth, data.log_records_written, data.log_records_dropped
+        ]]));
+        section.appendChild(createTable("Handlers",
+            ["Event", "Handler", "Calls", "Errors", "Responses", "Mean ms", "p95 ms"],
+            data.handlers.map(handler => [
+                handler.event, handler.handler, handler.calls, handler.errors,
+                handler.responses, formatMs(handler.mean_ms), formatMs(handler.p95_ms)
+            ])));
+    }
+
+    function fetchStatus() {
+        fetch("/status")
+            .then(response => response.json())
+            .then(data => { status.textContent = `Status: ${data.status}`; })
+            .catch(error => { status.textContent = "Status: unavailable"; });
+        fetch("/stats")
+            .then(response => response.json())
+            .then(stats => {
+                if (stats.totals) {
+                    renderStats(stats);
+                }
+            })
+            .catch(error => console.error('Error fetching stats:', error));
+        fetch("/dicom_metrics")
+            .then(response => response.json())
+            .then(renderMetrics)
+            .catch(error => console.error('Error fetching DICOM metrics:', error));
+    }
+
+    fetchStatus();
+    // Counters are kept server side, so refreshing is cheap
+    setInterval(fetchStatus, 10000);
+});
@@ -0,0 +1,508 @@
+"""Load generator and benchmark for DICOMHawk.
+
+Drives a weighted mix of the requests dicom-client.py sends (C-ECHO, C-FIND,
+C-STORE, C-MOVE and C-GET) from many concurrent associations and reports
+associations/s, per-DIMSE latency percentiles, server RSS and log bytes written.
+
+    # Start a local dicomhawk on a free port with its own logs and run a mix
+    python rest/dicom_benchmark.py --start-server --duration 30 --concurrency 16
+
+    # Record a baseline, then compare later runs against it. Baselines depend
+    # on the machine, so none is committed: record one before changing anything
+    python rest/dicom_benchmark.py --start-server --save-baseline baseline.json
+    python rest/dicom_benchmark.py --start-server --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ImplicitVRLittleEndian, generate_uid
+from pynetdicom import AE, evt, build_role
+from pynetdicom.sop_class import (
+    PatientRootQueryRetrieveInformationModelFind,
+    PatientRootQueryRetrieveInformationModelMove,
+    PatientRootQueryRetrieveInformationModelGet,
+    CTImageStorage,
+    MRImageStorage,
+    Verification
+)
+
+repository_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+server_script = os.path.join(repository_directory, 'dicom_server', 'dicomhawk.py')
+
+OPERATIONS = ('echo', 'find', 'store', 'move', 'get')
+DEFAULT_MIX = 'echo=2,find=4,store=2,move=1,get=1'
+
+# Latency and throughput may move by this fraction before a run counts as a regression
+DEFAULT_TOLERANCE = 0.2
+
+
+def parse_mix(value):
+    mix = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(','))):
+        name, weight = entry.split('=', 1)
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    if not mix or sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("The mix needs at least one operation with a positive weight")
+    return mix
+
+
+def parse_keys(values):
+    keys = {}
+    for value in values:
+        keyword, _, match = value.partition('=')
+        keys[keyword] = match
+    return keys
+
+
+# Same requests as dicom-client.py
+def find_identifier(keys):
+    ds = Dataset()
+    ds.QueryRetrieveLevel = 'PATIENT'
+    ds.PatientName = '*'
+    for keyword, value in keys.items():
+        setattr(ds, keyword, value)
+    return ds
+
+
+def store_dataset():
+    ds = Dataset()
+    ds.PatientName = 'Doe^John'
+    ds.PatientID = '12345'
+    ds.StudyDate = '20210101'
+    ds.Modality = 'CT'
+    # A new instance each time, so the server spools rather than deduplicates
+    ds.SOPInstanceUID = generate_uid()
+    ds.SOPClassUID = CTImageStorage
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    file_meta.TransferSyntaxUID = ImplicitVRLittleEndian
+    ds.file_meta = file_meta
+    return ds
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"dicomhawk exited with status {process.returncode} during startup")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"dicomhawk did not start listening on {host}:{port} within {timeout}s")
+
+
+# A dicomhawk process on 127.0.0.1 with its data directory in a temporary
+# directory, so the run measures exactly the log bytes it causes
+class LocalServer:
+    def __init__(self, archive, environment, startup_timeout):
+        self.directory = tempfile.mkdtemp(prefix='dicomhawk-bench-')
+        self.port = free_port()
+        self.sink_port = free_port()
+        if archive:
+            os.symlink(os.path.abspath(archive), os.path.join(self.directory, 'dicom_files'))
+        env = dict(os.environ)
+        env.update({
+            'DICOMHAWK_DATA_DIR': os.path.join(self.directory, 'data'),
+            'DICOM_HOST': '127.0.0.1',
+            'DICOM_PORTS': str(self.port),
+            'MOVE_SINK_PORT': str(self.sink_port),
+            # The load comes from one address, don't let the per-source limits throttle it
+            'RATE_LIMIT_PER_IP': '100000',
+            'RATE_LIMIT_BURST': '100000',
+            'MAX_CONNECTIONS_PER_IP': '100000',
+        })
+        env.update(environment)
+        self.output = open(os.path.join(self.directory, 'dicomhawk.out'), 'wb')
+        self.process = subprocess.Popen(
+            [sys.executable, '-u', server_script], cwd=self.directory, env=env,
+            stdout=self.output, stderr=subprocess.STDOUT
+        )
+        wait_for_port('127.0.0.1', self.port, startup_timeout, self.process)
+
+    @property
+    def log_directories(self):
+        data = os.path.join(self.directory, 'data')
+        return [os.path.join(data, 'logs'), os.path.join(data, 'simplified_logs')]
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.output.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# Resident memory of a process and its children (the workers of a
+# multi-process server), in bytes
+def process_tree_rss(pid):
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    total = 0
+    for process_id in pids:
+        try:
+            with open(f'/proc/{process_id}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+def log_bytes(directories):
+    total = 0
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.last = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.last = process_tree_rss(self.pid)
+            self.peak = max(self.peak, self.last)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.last = process_tree_rss(self.pid) or self.last
+        self.peak = max(self.peak, self.last)
+
+
+# One client thread: open an association, send ops_per_association requests
+# drawn from the mix, release, repeat until the run ends
+class Worker(threading.Thread):
+    def __init__(self, index, args, deadline, remaining):
+        super().__init__(daemon=True)
+        self.args = args
+        self.deadline = deadline
+        self.remaining = remaining
+        self.random = random.Random(args.seed + index)
+        self.operations = list(args.mix)
+        self.weights = [args.mix[name] for name in self.operations]
+        self.latencies = {name: [] for name in ('associate',) + OPERATIONS}
+        self.errors = {}
+        self.associations = 0
+        self.ae = AE(ae_title=args.calling_aet)
+        self.ae.acse_timeout = args.timeout
+        self.ae.dimse_timeout = args.timeout
+        self.ae.network_timeout = args.timeout
+        self.ae.add_requested_context(Verification)
+        self.ae.add_requested_context(PatientRootQueryRetrieveInformationModelFind)
+        self.ae.add_requested_context(PatientRootQueryRetrieveInformationModelMove)
+        self.ae.add_requested_context(PatientRootQueryRetrieveInformationModelGet)
+        self.ae.add_requested_context(CTImageStorage)
+        self.ae.add_requested_context(MRImageStorage)
+        # C-GET sends the instances back over the same association, so both
+        # roles are proposed for the storage classes
+        self.roles = [build_role(sop_class, scu_role=True, scp_role=True) for sop_class in (CTImageStorage, MRImageStorage)]
+        self.handlers = [(evt.EVT_C_STORE, lambda event: 0x0000)]
+
+    def error(self, name):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def take_association(self):
+        if time.monotonic() >= self.deadline:
+            return False
+        if self.remaining is None:
+            return True
+        with self.remaining['lock']:
+            if self.remaining['count'] <= 0:
+                return False
+            self.remaining['count'] -= 1
+            return True
+
+    def run(self):
+        while self.take_association():
+            start = time.perf_counter()
+            assoc = self.ae.associate(
+                self.args.host, self.args.port, ae_title=self.args.called_aet,
+                ext_neg=self.roles, evt_handlers=self.handlers
+            )
+            if not assoc.is_established:
+                self.error('associate')
+                time.sleep(0.05)
+                continue
+            self.latencies['associate'].append(time.perf_counter() - start)
+            try:
+                for _ in range(self.args.ops_per_association):
+                    name = self.random.choices(self.operations, self.weights)[0]
+                    start = time.perf_counter()
+                    try:
+                        completed = getattr(self, name)(assoc)
+                    except (RuntimeError, ValueError) as e:
+                        completed = False
+                        self.error(f"{name}: {e}")
+                        assoc.abort()
+                    if completed:
+                        self.latencies[name].append(time.perf_counter() - start)
+                    else:
+                        self.error(name)
+                    if not assoc.is_established:
+                        break
+            finally:
+                if assoc.is_established:
+                    assoc.release()
+            self.associations += 1
+
+    # Each request returns whether it completed with a success status
+    def echo(self, assoc):
+        status = assoc.send_c_echo()
+        return bool(status) and status.Status == 0x0000
+
+    def find(self, assoc):
+        final = None
+        for status, _ in assoc.send_c_find(find_identifier(self.args.find_keys), PatientRootQueryRetrieveInformationModelFind):
+            final = status
+        return bool(final) and final.Status == 0x0000
+
+    def store(self, assoc):
+        status = assoc.send_c_store(store_dataset())
+        return bool(status) and status.Status == 0x0000
+
+    def move(self, assoc):
+        final = None
+        for status, _ in assoc.send_c_move(find_identifier(self.args.retrieve_keys), self.args.move_destination, PatientRootQueryRetrieveInformationModelMove):
+            final = status
+        return bool(final) and final.Status in (0x0000, 0xB000)
+
+    def get(self, assoc):
+        final = None
+        for status, _ in assoc.send_c_get(find_identifier(self.args.retrieve_keys), PatientRootQueryRetrieveInformationModelGet):
+            final = status
+        return bool(final) and final.Status in (0x0000, 0xB000)
+
+
+def summarise(workers, elapsed, rss, log_written):
+    results = {
+        "elapsed": round(elapsed, 3),
+        "associations": sum(worker.associations for worker in workers),
+        "operations": {},
+        "errors": {},
+    }
+    results["associations_per_second"] = round(results["associations"] / elapsed, 2) if elapsed else 0
+    for name in ('associate',) + OPERATIONS:
+        latencies = sorted(latency for worker in workers for latency in worker.latencies[name])
+        if not latencies:
+            continue
+        results["operations"][name] = {
+            "count": len(latencies),
+            "per_second": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+    for worker in workers:
+        for name, count in worker.errors.items():
+            results["errors"][name] = results["errors"].get(name, 0) + count
+    if rss is not None:
+        results["server_rss_peak_bytes"] = rss.peak
+        results["server_rss_end_bytes"] = rss.last
+    if log_written is not None:
+        results["log_bytes_written"] = log_written
+        if results["associations"]:
+            results["log_bytes_per_association"] = round(log_written / results["associations"])
+    return results
+
+
+def print_results(results):
+    print(f"{results['associations']} associations in {results['elapsed']:.1f}s, "
+          f"{results['associations_per_second']:.1f} associations/s")
+    print(f"{'operation':<10} {'count':>8} {'per s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in results["operations"].items():
+        print(f"{name:<10} {stats['count']:>8} {stats['per_second']:>9.1f} {stats['p50_ms']:>9.2f} "
+              f"{stats['p90_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+    if results["errors"]:
+        print(f"errors: {results['errors']}")
+    if "server_rss_peak_bytes" in results:
+        print(f"server RSS: peak {results['server_rss_peak_bytes'] / 2**20:.1f} MiB, "
+              f"end {results['server_rss_end_bytes'] / 2**20:.1f} MiB")
+    if "log_bytes_written" in results:
+        print(f"log bytes written: {results['log_bytes_written']} "
+              f"({results.get('log_bytes_per_association', 0)} per association)")
+
+
+# Compare a run with a stored baseline, returning the regressions found
+def compare_with_baseline(results, baseline, tolerance):
+    regressions = []
+
+    def check(label, current, previous, higher_is_better):
+        if current is None or not previous:
+            return
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        marker = ''
+        if worse > tolerance:
+            regressions.append(label)
+            marker = '  REGRESSION'
+        print(f"  {label:<32} {previous:>12.2f} -> {current:>12.2f} ({change:+.1%}){marker}")
+
+    print(f"Compared with baseline (tolerance {tolerance:.0%}):")
+    check('associations/s', results['associations_per_second'], baseline.get('associations_per_second'), True)
+    for name, stats in results['operations'].items():
+        previous = baseline.get('operations', {}).get(name)
+        if previous:
+            check(f'{name} p50 ms', stats['p50_ms'], previous['p50_ms'], False)
+            check(f'{name} p99 ms', stats['p99_ms'], previous['p99_ms'], False)
+    check('server RSS peak bytes', results.get('server_rss_peak_bytes'), baseline.get('server_rss_peak_bytes'), False)
+    check('log bytes per association', results.get('log_bytes_per_association'), baseline.get('log_bytes_per_association'), False)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost', help="DICOM server address (ignored with --start-server)")
+    parser.add_argument('--port', type=int, default=11112, help="DICOM server port (ignored with --start-server)")
+    parser.add_argument('--called-aet', default='ANY-SCP')
+    parser.add_argument('--calling-aet', default='BENCHMARK')
+    parser.add_argument('--start-server', action='store_true',
+                        help="start a local dicomhawk with its data in a temporary directory")
+    parser.add_argument('--archive', help="decoy archive for --start-server, ten fake files are generated by default")
+    parser.add_argument('--server-env', action='append', default=[], metavar='NAME=VALUE',
+                        help="environment variable for --start-server, e.g. DETAILED_LOG_MODE=summary")
+    parser.add_argument('--server-pid', type=int, help="PID of an already running server to sample RSS from")
+    parser.add_argument('--log-dir', action='append', default=[],
+                        help="log directory of an already running server to measure bytes written in")
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"operation weights, default {DEFAULT_MIX}")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent associations")
+    parser.add_argument('--duration', type=float, default=10, help="seconds to run")
+    parser.add_argument('--associations', type=int, help="stop after this many associations")
+    parser.add_argument('--ops-per-association', type=int, default=1)
+    parser.add_argument('--find-key', action='append', default=[], metavar='KEYWORD=VALUE',
+                        help="C-FIND matching key, PatientName=* by default")
+    parser.add_argument('--retrieve-key', action='append', default=[], metavar='KEYWORD=VALUE',
+                        help="C-GET and C-MOVE matching key, PatientName=* by default")
+    parser.add_argument('--move-destination', default='DICOMHAWK_SINK',
+                        help="C-MOVE destination AE title, the server's stand-in sink by default")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--save-baseline', help="store the results as a baseline")
+    parser.add_argument('--baseline', help="compare with a stored baseline, exit 1 on regression")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    if args.baseline and not os.path.exists(args.baseline):
+        parser.error(f"baseline {args.baseline} not found, record one first by running the same command "
+                     f"with --save-baseline {args.baseline} instead of --baseline")
+    args.find_keys = parse_keys(args.find_key)
+    args.retrieve_keys = parse_keys(args.retrieve_key)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = None
+    pid = args.server_pid
+    log_directories = args.log_dir
+    if args.start_server:
+        server = LocalServer(args.archive, parse_keys(args.server_env), args.startup_timeout)
+        args.host, args.port = '127.0.0.1', server.port
+        pid = server.process.pid
+        log_directories = server.log_directories
+    try:
+        rss = RssSampler(pid) if pid else None
+        logs_before = log_bytes(log_directories) if log_directories else None
+        remaining = {'count': args.associations, 'lock': threading.Lock()} if args.associations else None
+        start = time.monotonic()
+        workers = [Worker(index, args, start + args.duration, remaining) for index in range(args.concurrency)]
+        if rss is not None:
+            rss.start()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - start
+        if rss is not None:
+            rss.stop()
+        log_written = None
+        if logs_before is not None:
+            # Logs are written asynchronously, give the listener a moment to catch up
+            time.sleep(1)
+            log_written = log_bytes(log_directories) - logs_before
+    finally:
+        if server is not None:
+            server.stop()
+
+    results = summarise(workers, elapsed, rss, log_written)
+    results["config"] = {
+        "mix": args.mix,
+        "concurrency": args.concurrency,
+        "ops_per_association": args.ops_per_association,
+        "server_env": args.server_env,
+        "archive": args.archive,
+        "find_key": args.find_key,
+        "retrieve_key": args.retrieve_key,
+    }
+    # How the results were produced, so a baseline can be recorded again
+    results["command"] = shlex.join(['python', sys.argv[0]] + (sys.argv[1:] if argv is None else list(argv)))
+    print_results(results)
+    for path in filter(None, (args.json, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"]:
+            print("Warning: the baseline was recorded with a different configuration")
+        if compare_with_baseline(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The DICOM server and the log server are scripts, not packages
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'dicom_server'))
+sys.path.insert(0, os.path.join(root, 'flask_logging_server'))
@@ -0,0 +1,97 @@
+from pydicom.dataset import Dataset
+from pydicom.multival import MultiValue
+
+from dicomhawk import AttributeIndex
+
+
+def make_record(patient_name, patient_id, study_uid, modality, study_date):
+    return {
+        'PatientName': patient_name,
+        'PatientID': patient_id,
+        'StudyInstanceUID': study_uid,
+        'Modality': modality,
+        'StudyDate': study_date,
+    }
+
+
+CATALOG = {
+    '/a/1': make_record('HANSEN^ANNA', 'P001', '1.2.1', 'CT', '20200101'),
+    '/a/2': make_record('HANSEN^BO', 'P002', '1.2.2', 'MR', '20210315'),
+    '/a/3': make_record('JENSEN^BO', 'P003', '1.2.3', 'CT', '20221130'),
+    '/a/4': make_record('NIELSEN^CARL', 'P004', '1.2.4', 'US', ''),
+    '/a/5': make_record('HANSEN^ANNA', 'P001', '1.2.1', 'MR', '20200101'),
+}
+
+
+def query(**keys):
+    identifier = Dataset()
+    for keyword, value in keys.items():
+        setattr(identifier, keyword, value)
+    return identifier
+
+
+def brute_force(catalog, test):
+    return [key for key, record in catalog.items() if test(record)]
+
+
+def test_exact_match():
+    index = AttributeIndex(CATALOG)
+    assert index.match(query(PatientID='P001')) == ['/a/1', '/a/5']
+    assert index.match(query(PatientID='P001', Modality='MR')) == ['/a/5']
+    assert index.match(query(PatientID='P999')) == []
+
+
+def test_universal_values_match_everything():
+    index = AttributeIndex(CATALOG)
+    assert index.match(query(PatientName='*', Modality='')) == list(CATALOG)
+    assert index.match(query()) == list(CATALOG)
+
+
+def test_wildcards():
+    index = AttributeIndex(CATALOG)
+    assert index.match(query(PatientName='HANSEN*')) == ['/a/1', '/a/2', '/a/5']
+    assert index.match(query(PatientName='*^BO')) == ['/a/2', '/a/3']
+    assert index.match(query(PatientName='?ANSEN^ANNA')) == ['/a/1', '/a/5']
+    assert index.match(query(PatientID='P00?', Modality='CT')) == ['/a/1', '/a/3']
+
+
+def test_date_ranges():
+    index = AttributeIndex(CATALOG)
+    assert index.match(query(StudyDate='20210101-')) == ['/a/2', '/a/3']
+    assert index.match(query(StudyDate='-20210315')) == ['/a/1', '/a/2', '/a/5']
+    assert index.match(query(StudyDate='20200101-20210315')) == ['/a/1', '/a/2', '/a/5']
+    assert index.match(query(StudyDate='20221130')) == ['/a/3']
+
+
+def test_uid_lists():
+    index = AttributeIndex(CATALOG)
+    uids = MultiValue(str, ['1.2.1', '1.2.3', '1.2.9'])
+    assert index.match(query(StudyInstanceUID=uids)) == ['/a/1', '/a/3', '/a/5']
+    assert index.match(query(StudyInstanceUID=uids, Modality='CT')) == ['/a/1', '/a/3']
+
+
+def test_updated_matches_a_rebuild():
+    index = AttributeIndex(CATALOG)
+    catalog = {key: record for key, record in CATALOG.items() if key not in ('/a/2', '/a/4')}
+    added = {
+        '/a/6': make_record('HANSEN^DORTE', 'P006', '1.2.6', 'XA', '20230704'),
+        '/a/7': make_record('JENSEN^BO', 'P003', '1.2.3', 'CT', '20221130'),
+    }
+    catalog.update(added)
+    updated = index.updated(catalog, ['/a/2', '/a/4'], added)
+    rebuilt = AttributeIndex(catalog)
+
+    queries = [
+        (query(PatientName='HANSEN*'), lambda record: record['PatientName'].startswith('HANSEN')),
+        (query(Modality='US'), lambda record: record['Modality'] == 'US'),
+        (query(Modality='XA'), lambda record: record['Modality'] == 'XA'),
+        (query(StudyDate='20210101-'), lambda record: record['StudyDate'] >= '20210101'),
+        (query(PatientID='P003'), lambda record: record['PatientID'] == 'P003'),
+    ]
+    for identifier, test in queries:
+        assert updated.match(identifier) == rebuilt.match(identifier) == brute_force(catalog, test)
+    assert updated.sorted_values == rebuilt.sorted_values
+
+    # The old index still answers for the archive it was built from
+    assert index.match(query(Modality='US')) == ['/a/4']
+    assert index.match(query(Modality='XA')) == []
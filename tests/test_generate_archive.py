@@ -0,0 +1,32 @@
+import os
+
+from generate_archive import MODALITIES, make_uid, plan_archive
+
+
+def test_seeded_plan_uids_are_unique(tmp_path):
+    plan = plan_archive(str(tmp_path), 40, list(MODALITIES), 0)
+    # Instance UIDs are made the way write_series makes them, without writing files
+    instance_uids = []
+    for series in plan:
+        for number in range(1, series['instances'] + 1):
+            instance_uids.append(make_uid(series['uid_seed'], 'instance', series['series_uid'], number))
+
+    # Each series repeats its study's UID, one entry per study directory
+    study_uids = list({os.path.dirname(series['directory']): series['study_uid'] for series in plan}.values())
+    series_uids = [series['series_uid'] for series in plan]
+    uids = study_uids + series_uids + instance_uids
+    assert len(series_uids) == len(set(series_uids))
+    assert len(uids) == len(set(uids))
+
+
+def test_seeded_plan_is_reproducible(tmp_path):
+    first = plan_archive(str(tmp_path), 5, list(MODALITIES), 7)
+    second = plan_archive(str(tmp_path), 5, list(MODALITIES), 7)
+    assert first == second
+    assert plan_archive(str(tmp_path), 5, list(MODALITIES), 8) != first
+
+
+def test_uid_levels_do_not_collide():
+    # pydicom joins entropy sources without a separator
+    assert make_uid(0, 'study', 11, 1) != make_uid(0, 'series', 1, 1, 1)
+    assert make_uid(0, 'study', 11, 1) != make_uid(0, 'study', 1, 11)
@@ -0,0 +1,139 @@
+from pydicom.dataset import Dataset
+from pydicom.multival import MultiValue
+
+from dicomhawk import AttributeIndex, QueryHierarchy
+
+
+def make_record(patient, study, series, instance, **keys):
+    record = {
+        'PatientName': f'PATIENT^{patient}',
+        'PatientID': f'P{patient}',
+        'PatientBirthDate': '19800101',
+        'PatientSex': 'F',
+        'StudyInstanceUID': f'1.2.{patient}.{study}',
+        'StudyDate': '20200101',
+        'StudyTime': '120000',
+        'StudyID': str(study),
+        'AccessionNumber': f'A{patient}{study}',
+        'StudyDescription': 'DECOY',
+        'ReferringPhysicianName': 'DR',
+        'SeriesInstanceUID': f'1.2.{patient}.{study}.{series}',
+        'SeriesNumber': str(series),
+        'Modality': 'CT',
+        'SOPClassUID': '1.2.840.10008.5.1.4.1.1.2',
+        'SOPInstanceUID': f'1.2.{patient}.{study}.{series}.{instance}',
+        'InstanceNumber': str(instance),
+        'TransferSyntaxUID': '1.2.840.10008.1.2.1',
+    }
+    record.update(keys)
+    return record
+
+
+def make_catalog():
+    catalog = {}
+    # Patient 1: two studies, the second with a CT and an MR series
+    for instance in range(3):
+        catalog[f'/a/1/0/0/{instance}'] = make_record(1, 0, 0, instance)
+    for instance in range(2):
+        catalog[f'/a/1/1/0/{instance}'] = make_record(1, 1, 0, instance, StudyDate='20210315')
+    for instance in range(2):
+        catalog[f'/a/1/1/1/{instance}'] = make_record(1, 1, 1, instance, StudyDate='20210315', Modality='MR')
+    # Patient 2: one US study
+    for instance in range(2):
+        catalog[f'/a/2/0/0/{instance}'] = make_record(2, 0, 0, instance, StudyDate='20230704', Modality='US')
+    return catalog
+
+
+def make_hierarchy(catalog):
+    return QueryHierarchy(catalog, AttributeIndex(catalog))
+
+
+def query(level, **keys):
+    identifier = Dataset()
+    identifier.QueryRetrieveLevel = level
+    for keyword, value in keys.items():
+        setattr(identifier, keyword, value)
+    return identifier
+
+
+def keys(hierarchy, level, **query_keys):
+    return [key for key, _ in hierarchy.match(level, query(level, **query_keys))]
+
+
+def test_levels_and_counts():
+    hierarchy = make_hierarchy(make_catalog())
+    assert keys(hierarchy, 'PATIENT', PatientName='*') == ['P1', 'P2']
+    patient = hierarchy.records['PATIENT']['P1']
+    assert patient['NumberOfPatientRelatedStudies'] == 2
+    assert patient['NumberOfPatientRelatedSeries'] == 3
+    assert patient['NumberOfPatientRelatedInstances'] == 7
+
+    study = hierarchy.records['STUDY']['1.2.1.1']
+    assert study['ModalitiesInStudy'] == ['CT', 'MR']
+    assert study['NumberOfStudyRelatedSeries'] == 2
+    assert study['NumberOfStudyRelatedInstances'] == 4
+    assert hierarchy.records['SERIES']['1.2.1.1.1']['NumberOfSeriesRelatedInstances'] == 2
+
+
+def test_study_matching():
+    hierarchy = make_hierarchy(make_catalog())
+    assert keys(hierarchy, 'STUDY', PatientID='P1') == ['1.2.1.0', '1.2.1.1']
+    assert keys(hierarchy, 'STUDY', StudyDate='20210101-') == ['1.2.1.1', '1.2.2.0']
+    assert keys(hierarchy, 'STUDY', PatientName='PATIENT^?', StudyDate='-20201231') == ['1.2.1.0']
+    # A study matches a modality when any of its series has it
+    assert keys(hierarchy, 'STUDY', ModalitiesInStudy='MR') == ['1.2.1.1']
+    assert keys(hierarchy, 'STUDY', StudyInstanceUID='1.2.2.0') == ['1.2.2.0']
+    uids = MultiValue(str, ['1.2.1.0', '1.2.2.0'])
+    assert keys(hierarchy, 'STUDY', StudyInstanceUID=uids) == ['1.2.1.0', '1.2.2.0']
+    # Non-indexed study attributes are checked on the study records
+    assert keys(hierarchy, 'STUDY', AccessionNumber='A1*') == ['1.2.1.0', '1.2.1.1']
+
+
+def test_series_and_image_matching():
+    hierarchy = make_hierarchy(make_catalog())
+    assert keys(hierarchy, 'SERIES', StudyInstanceUID='1.2.1.1') == ['1.2.1.1.0', '1.2.1.1.1']
+    assert keys(hierarchy, 'SERIES', StudyInstanceUID='1.2.1.1', Modality='MR') == ['1.2.1.1.1']
+    assert keys(hierarchy, 'IMAGE', SeriesInstanceUID='1.2.1.1.1') == ['/a/1/1/1/0', '/a/1/1/1/1']
+    assert keys(hierarchy, 'IMAGE', SOPInstanceUID='1.2.2.0.0.1') == ['/a/2/0/0/1']
+    assert keys(hierarchy, 'IMAGE', SeriesInstanceUID='1.2.1.0.0', InstanceNumber='2') == ['/a/1/0/0/2']
+    assert keys(hierarchy, 'IMAGE', SOPInstanceUID='9.9.9') == []
+
+
+def test_match_instances():
+    hierarchy = make_hierarchy(make_catalog())
+    assert hierarchy.match_instances(query('STUDY', StudyInstanceUID='1.2.1.1')) == [
+        '/a/1/1/0/0', '/a/1/1/0/1', '/a/1/1/1/0', '/a/1/1/1/1',
+    ]
+    # The series UID only narrows the selection at SERIES and IMAGE level
+    assert len(hierarchy.match_instances(query('STUDY', StudyInstanceUID='1.2.1.1', SeriesInstanceUID='1.2.1.1.1'))) == 4
+    assert hierarchy.match_instances(query('SERIES', SeriesInstanceUID='1.2.1.1.1')) == ['/a/1/1/1/0', '/a/1/1/1/1']
+    uids = MultiValue(str, ['1.2.1.0.0.0', '1.2.2.0.0.1'])
+    assert hierarchy.match_instances(query('IMAGE', SOPInstanceUID=uids)) == ['/a/1/0/0/0', '/a/2/0/0/1']
+    assert hierarchy.match_instances(query('PATIENT', PatientID='P2')) == ['/a/2/0/0/0', '/a/2/0/0/1']
+
+
+def test_updated_matches_a_rebuild():
+    catalog = make_catalog()
+    hierarchy = make_hierarchy(catalog)
+    removed = ['/a/1/1/1/0', '/a/1/1/1/1', '/a/2/0/0/0']
+    added = {
+        '/a/3/0/0/0': make_record(3, 0, 0, 0, Modality='MR'),
+        '/a/1/0/0/3': make_record(1, 0, 0, 3),
+    }
+    new_catalog = {path: record for path, record in catalog.items() if path not in removed}
+    new_catalog.update(added)
+    index = hierarchy.index.updated(new_catalog, removed, added)
+    updated = hierarchy.updated(new_catalog, index, removed, added)
+    rebuilt = make_hierarchy(new_catalog)
+
+    for level in ('PATIENT', 'STUDY', 'SERIES'):
+        assert updated.records[level] == rebuilt.records[level]
+    assert updated.series_instances == rebuilt.series_instances
+    assert updated.patient_instances == rebuilt.patient_instances
+    assert updated.instances_by_uid == rebuilt.instances_by_uid
+    assert updated.storage_contexts == rebuilt.storage_contexts
+    assert keys(updated, 'STUDY', ModalitiesInStudy='MR') == keys(rebuilt, 'STUDY', ModalitiesInStudy='MR') == ['1.2.3.0']
+
+    # The old hierarchy is left as it was for requests still using it
+    assert keys(hierarchy, 'STUDY', ModalitiesInStudy='MR') == ['1.2.1.1']
+    assert hierarchy.records['STUDY']['1.2.1.1']['NumberOfStudyRelatedInstances'] == 4
@@ -0,0 +1,92 @@
+import atexit
+import glob
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The log server opens its log files when it is imported
+data_directory = tempfile.mkdtemp(prefix='dicomhawk-test-')
+atexit.register(shutil.rmtree, data_directory, ignore_errors=True)
+for name in ('logs', 'simplified_logs'):
+    os.makedirs(os.path.join(data_directory, name))
+os.environ['DICOMHAWK_DATA_DIR'] = data_directory
+
+import logserver
+from dicomhawk import compress_log_file
+
+
+@pytest.fixture
+def log_path():
+    path = logserver.simplified_log_file_path
+    with logserver.simplified_index_lock:
+        for segment in glob.glob(path + '*'):
+            os.remove(segment)
+        logserver.simplified_index.clear()
+    return path
+
+
+def write_entries(path, numbers):
+    with open(path, 'a') as f:
+        for number in numbers:
+            f.write(json.dumps({'n': number}) + '\n')
+
+
+def read_page(cursor, limit):
+    entries, cursor, has_more, total, cursor_lost = logserver.read_simplified_page(cursor, limit)
+    return [entry['n'] for entry in entries], cursor, has_more, total, cursor_lost
+
+
+def test_pages_cross_rotated_segments(log_path):
+    write_entries(log_path, range(5))
+    numbers, cursor, has_more, total, _ = read_page(None, 3)
+    assert (numbers, has_more, total) == ([0, 1, 2], True, 5)
+
+    os.rename(log_path, log_path + '.20240101')
+    write_entries(log_path, range(5, 9))
+    numbers, cursor, has_more, total, cursor_lost = read_page(cursor, 4)
+    assert (numbers, has_more, total, cursor_lost) == ([3, 4, 5, 6], True, 9, False)
+    numbers, cursor, has_more, _, _ = read_page(cursor, 10)
+    assert (numbers, has_more) == ([7, 8], False)
+
+    # Nothing new: the cursor stays put until the live file grows
+    assert read_page(cursor, 10)[:3] == ([], cursor, False)
+    write_entries(log_path, [9])
+    assert read_page(cursor, 10)[0] == [9]
+
+
+def test_cursors_survive_compression(log_path):
+    rotated = log_path + '.20240101'
+    write_entries(log_path, range(5))
+    _, first_cursor, _, _, _ = read_page(None, 1)
+    _, rotated_cursor, _, _, _ = read_page(first_cursor, 2)
+    os.rename(log_path, rotated)
+    write_entries(log_path, range(5, 8))
+
+    # The DICOM server compresses the rotated file and later removes it
+    compress_log_file(rotated)
+    os.remove(rotated)
+    assert os.path.exists(rotated + '.gz')
+
+    numbers, cursor, has_more, total, cursor_lost = read_page(rotated_cursor, 1)
+    assert (numbers, has_more, total, cursor_lost) == ([3], True, 8, False)
+    # Paging on continues inside the compressed segment, then into the live file
+    numbers, cursor, has_more, _, cursor_lost = read_page(cursor, 3)
+    assert (numbers, has_more, cursor_lost) == ([4, 5, 6], True, False)
+    assert read_page(cursor, 10)[0] == [7]
+
+    # Cursors taken before the rotation and from the start still read everything
+    assert read_page(first_cursor, 10)[0] == [1, 2, 3, 4, 5, 6, 7]
+    assert read_page(None, 10)[0] == list(range(8))
+
+
+def test_unknown_cursor_resumes_at_live_file(log_path):
+    write_entries(log_path, range(3))
+    os.rename(log_path, log_path + '.20240101')
+    write_entries(log_path, range(3, 5))
+
+    numbers, cursor, has_more, total, cursor_lost = read_page('999999999:0', 10)
+    assert (numbers, has_more, total, cursor_lost) == ([3, 4], False, 5, True)
+    assert read_page(cursor, 10)[4] is False
@@ -0,0 +1,96 @@
+import hashlib
+import os
+from io import BytesIO
+from types import SimpleNamespace
+
+from pydicom import dcmread
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.filebase import DicomBytesIO
+from pydicom.filewriter import write_dataset
+from pydicom.uid import ExplicitVRLittleEndian
+
+from dicomhawk import Spool, read_store_header
+
+CT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.2'
+
+
+# A C-STORE event as pynetdicom hands it over: the dataset still encoded
+def make_event(sop_instance_uid, comments=''):
+    ds = Dataset()
+    ds.SOPClassUID = CT_IMAGE_STORAGE
+    ds.SOPInstanceUID = sop_instance_uid
+    ds.PatientName = 'HANSEN^ANNA'
+    ds.Modality = 'CT'
+    if comments:
+        ds.ImageComments = comments
+    encoded = DicomBytesIO()
+    encoded.is_little_endian = True
+    encoded.is_implicit_VR = False
+    write_dataset(encoded, ds)
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = CT_IMAGE_STORAGE
+    file_meta.MediaStorageSOPInstanceUID = sop_instance_uid
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    return SimpleNamespace(
+        request=SimpleNamespace(DataSet=BytesIO(encoded.getvalue())),
+        file_meta=file_meta,
+        context=SimpleNamespace(transfer_syntax=ExplicitVRLittleEndian),
+    )
+
+
+def open_spool(directory, max_bytes):
+    spool = Spool(str(directory), max_bytes)
+    spool.open()
+    return spool
+
+
+def test_store_writes_a_content_addressed_file(tmp_path):
+    spool = open_spool(tmp_path, 1 << 20)
+    sha256, size, spooled = spool.store(make_event('1.2.3.1'))
+    path = tmp_path / sha256[:2] / f'{sha256}.dcm'
+    assert spooled
+    assert path.stat().st_size == size
+    assert hashlib.sha256(path.read_bytes()).hexdigest() == sha256
+    ds = dcmread(str(path))
+    assert ds.SOPInstanceUID == '1.2.3.1'
+    assert ds.file_meta.TransferSyntaxUID == ExplicitVRLittleEndian
+
+    # The same content again is kept once
+    assert spool.store(make_event('1.2.3.1')) == (sha256, size, True)
+    assert spool.size == size
+    assert len(list(tmp_path.rglob('*'))) == 2
+
+
+def test_oldest_files_are_evicted(tmp_path):
+    first = make_event('1.2.3.1', 'x' * 200)
+    size = open_spool(tmp_path / 'probe', 1 << 20).store(first)[1]
+    spool = open_spool(tmp_path / 'spool', 2 * size + size // 2)
+    stored = [spool.store(make_event(f'1.2.3.{n}', 'x' * 200))[0] for n in range(1, 4)]
+    assert list(spool.files) == [str(tmp_path / 'spool' / sha256[:2] / f'{sha256}.dcm') for sha256 in stored[1:]]
+    assert sorted(path.name for path in (tmp_path / 'spool').rglob('*.dcm')) == sorted(f'{sha256}.dcm' for sha256 in stored[1:])
+
+    # Larger than the whole spool: hashed and logged, never written
+    sha256, too_big, spooled = spool.store(make_event('1.2.3.9', 'x' * (3 * size)))
+    assert not spooled and too_big > spool.max_bytes
+    assert not os.path.exists(tmp_path / 'spool' / sha256[:2] / f'{sha256}.dcm')
+
+
+def test_open_picks_up_spooled_files(tmp_path):
+    spool = open_spool(tmp_path, 1 << 20)
+    spool.store(make_event('1.2.3.1'))
+    spool.store(make_event('1.2.3.2'))
+    leftover = tmp_path / 'ab' / 'interrupted.dcm.1.2.tmp'
+    leftover.parent.mkdir()
+    leftover.write_bytes(b'partial')
+
+    reopened = open_spool(tmp_path, 1 << 20)
+    assert set(reopened.files) == set(spool.files)
+    assert reopened.size == spool.size
+    assert not leftover.exists()
+
+
+def test_read_store_header_decodes_only_the_logged_attributes():
+    header = read_store_header(make_event('1.2.3.1', 'not logged'))
+    assert header['SOPInstanceUID'] == '1.2.3.1'
+    assert header['PatientName'] == 'HANSEN^ANNA'
+    assert 'ImageComments' not in header